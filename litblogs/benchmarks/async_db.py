@@ -0,0 +1,74 @@
+# benchmarks/async_db.py
+"""Concurrent-request latency with the sync Session vs the AsyncSession.
+
+Simulates N in-flight async handlers that each run one slow query, once with
+the blocking sync session (the old path) and once with the asyncio session.
+
+    cd litblogs && python -m benchmarks.async_db --requests 50 --query-ms 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+
+from database import SessionLocal, AsyncSessionLocal, engine
+
+
+def slow_query(query_ms: int):
+    if engine.dialect.name == "postgresql":
+        return text("SELECT pg_sleep(:seconds)").bindparams(seconds=query_ms / 1000)
+    # SQLite has no sleep; burn roughly query_ms of CPU inside the engine instead
+    return text(
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :rows) "
+        "SELECT count(*) FROM n"
+    ).bindparams(rows=query_ms * 20000)
+
+
+async def sync_handler(statement):
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        db.execute(statement)
+    finally:
+        db.close()
+    return time.perf_counter() - start
+
+
+async def async_handler(statement):
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await db.execute(statement)
+    return time.perf_counter() - start
+
+
+async def run(handler, statement, requests: int):
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(handler(statement) for _ in range(requests)))
+    return time.perf_counter() - start, sorted(latencies)
+
+
+def report(name, wall, latencies):
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:>6}: wall {wall * 1000:8.1f} ms | "
+        f"p50 {statistics.median(latencies) * 1000:8.1f} ms | "
+        f"p95 {p95 * 1000:8.1f} ms | max {latencies[-1] * 1000:8.1f} ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--query-ms", type=int, default=20)
+    args = parser.parse_args()
+
+    statement = slow_query(args.query_ms)
+    print(f"{args.requests} concurrent requests, ~{args.query_ms} ms query, {engine.dialect.name}")
+    report("sync", *await run(sync_handler, statement, args.requests))
+    report("async", *await run(async_handler, statement, args.requests))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
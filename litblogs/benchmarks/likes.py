@@ -0,0 +1,129 @@
+# benchmarks/likes.py
+"""A burst of like toggles: read-then-write vs the conflict-free engine, unbuffered and buffered.
+
+Creates a throwaway class, post and users, fires --toggles toggles from
+--users users at one post (at most --concurrency in flight), then checks
+that the post's like_count matches its like rows. Everything created is
+removed afterwards.
+
+    cd litblogs && python -m benchmarks.likes --toggles 1000 --users 100
+"""
+import argparse
+import asyncio
+import random
+import secrets
+import time
+from collections import Counter
+
+from sqlalchemy import delete, func, select
+
+import models
+from counters import post_counts_update
+from database import AsyncSessionLocal, async_engine
+from likes import POST_LIKES, LikeBuffer
+
+
+async def read_then_write(post_id: int, user_id: int):
+    # The old like_post body
+    async with AsyncSessionLocal() as db:
+        existing_like = await db.scalar(
+            select(models.PostLike).where(models.PostLike.post_id == post_id, models.PostLike.user_id == user_id)
+        )
+        if existing_like:
+            await db.delete(existing_like)
+            await db.execute(post_counts_update(post_id, likes=-1))
+        else:
+            db.add(models.PostLike(post_id=post_id, user_id=user_id))
+            await db.execute(post_counts_update(post_id, likes=1))
+        await db.commit()
+
+
+def engine_toggle(buffer: LikeBuffer):
+    async def toggle(post_id: int, user_id: int):
+        async with AsyncSessionLocal() as db:
+            await buffer.toggle(db, post_id, user_id)
+    return toggle
+
+
+async def create_fixtures(users: int):
+    tag = secrets.token_hex(4)
+    async with AsyncSessionLocal() as db:
+        people = [
+            models.User(username=f"bench_{tag}_{i}", email=f"bench_{tag}_{i}@example.com", password="x")
+            for i in range(users)
+        ]
+        class_ = models.Class(name=f"bench {tag}", access_code=secrets.token_hex(3).upper())
+        db.add_all([*people, class_])
+        await db.commit()
+        return class_.id, [user.id for user in people]
+
+
+async def create_post(class_id: int, owner_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        post = models.Blog(title="bench", content="bench", owner_id=owner_id, class_id=class_id)
+        db.add(post)
+        await db.commit()
+        return post.id
+
+
+async def check_post(post_id: int):
+    async with AsyncSessionLocal() as db:
+        counter = await db.scalar(select(models.Blog.like_count).where(models.Blog.id == post_id))
+        rows = await db.scalar(select(func.count()).select_from(models.PostLike).where(models.PostLike.post_id == post_id))
+        return counter, rows
+
+
+async def remove_fixtures(class_id: int, user_ids: list):
+    async with AsyncSessionLocal() as db:
+        post_ids = select(models.Blog.id).where(models.Blog.class_id == class_id)
+        await db.execute(delete(models.PostLike).where(models.PostLike.post_id.in_(post_ids)))
+        await db.execute(delete(models.Blog).where(models.Blog.class_id == class_id))
+        await db.execute(delete(models.Class).where(models.Class.id == class_id))
+        await db.execute(delete(models.User).where(models.User.id.in_(user_ids)))
+        await db.commit()
+
+
+async def burst(name, toggle, class_id, user_ids, args):
+    post_id = await create_post(class_id, user_ids[0])
+    clicks = [random.choice(user_ids) for _ in range(args.toggles)]
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def click(user_id):
+        async with limit:
+            await toggle(post_id, user_id)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(click(user_id) for user_id in clicks), return_exceptions=True)
+    wall = time.perf_counter() - start
+    errors = Counter(type(result).__name__ for result in results if isinstance(result, Exception))
+    counter, rows = await check_post(post_id)
+    print(
+        f"{name:>16}: {wall * 1000:8.1f} ms | {args.toggles / wall:8.0f} toggles/s | "
+        f"errors {sum(errors.values()):4d} | like_count {counter} vs {rows} rows{'' if counter == rows else '  MISMATCH'}"
+    )
+    for kind, count in errors.most_common():
+        print(f"{'':>16}  {count} x {kind}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--toggles", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--window-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{args.toggles} toggles by {args.users} users, {args.concurrency} in flight, {async_engine.dialect.name}")
+    class_id, user_ids = await create_fixtures(args.users)
+    try:
+        await burst("read-then-write", read_then_write, class_id, user_ids, args)
+        await burst("engine", engine_toggle(LikeBuffer(POST_LIKES, 0, 1)), class_id, user_ids, args)
+        buffered = LikeBuffer(POST_LIKES, args.window_ms, 500)
+        await burst(f"buffered {args.window_ms:g} ms", engine_toggle(buffered), class_id, user_ids, args)
+        print(f"{'':>16}  {buffered.flushes} flushes, {buffered.coalesced} toggles coalesced")
+    finally:
+        await remove_fixtures(class_id, user_ids)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
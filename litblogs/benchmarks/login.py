@@ -0,0 +1,68 @@
+# benchmarks/login.py
+"""Login throughput with N concurrent clients, inline vs pooled bcrypt.
+
+Each simulated login verifies one password. The inline run calls passlib on
+the event loop (the old path); the pooled run goes through passwords.py. A
+ticker coroutine measures how long the loop is blocked in each run.
+
+    cd litblogs && python -m benchmarks.login --clients 32
+"""
+import argparse
+import asyncio
+import time
+
+from passwords import pwd_context, verify_password, hash_metrics, HASH_WORKERS
+
+
+async def inline_login(password, hashed):
+    return pwd_context.verify(password, hashed)
+
+
+async def pooled_login(password, hashed):
+    valid, _ = await verify_password(password, hashed)
+    return valid
+
+
+async def ticker(stop: asyncio.Event, lags: list):
+    # Sleeps 10 ms at a time; any extra delay is time the loop was blocked
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start - 0.01)
+
+
+async def run(login, clients: int, password: str, hashed: str):
+    stop = asyncio.Event()
+    lags = []
+    tick = asyncio.create_task(ticker(stop, lags))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(login(password, hashed) for _ in range(clients)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await tick
+    assert all(results)
+    return wall, max(lags, default=0.0)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    args = parser.parse_args()
+
+    password = "correct horse battery staple"
+    hashed = pwd_context.hash(password)
+    print(f"{args.clients} concurrent logins, {HASH_WORKERS} hash workers")
+
+    for name, login in (("inline", inline_login), ("pooled", pooled_login)):
+        wall, max_lag = await run(login, args.clients, password, hashed)
+        print(
+            f"{name:>6}: {args.clients / wall:7.1f} logins/s | "
+            f"wall {wall * 1000:8.1f} ms | max loop stall {max_lag * 1000:8.1f} ms"
+        )
+
+    print("pool metrics:", hash_metrics.snapshot())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,150 @@
+# benchmarks/roster.py
+"""Enrolling a roster: one join_class-style transaction per student vs the bulk roster import.
+
+Creates a throwaway teacher, classes and --students students, then enrolls
+them by replaying join_class once per student, by importing the roster for
+already-registered students (twice; the second import finds everyone
+enrolled), and by importing a roster of brand-new emails (which also creates
+their accounts). Everything created is removed afterwards.
+
+    cd litblogs && python -m benchmarks.roster --students 2000
+"""
+import argparse
+import asyncio
+import secrets
+import time
+
+from sqlalchemy import delete, func, select
+
+import models
+from database import AsyncSessionLocal, async_engine
+from roster import import_roster
+
+
+async def join_class(access_code: str, student_id: int):
+    # The join_class body
+    async with AsyncSessionLocal() as db:
+        class_ = await db.scalar(select(models.Class).where(models.Class.access_code == access_code))
+        existing_enrollment = await db.scalar(
+            select(models.ClassEnrollment).where(
+                models.ClassEnrollment.student_id == student_id,
+                models.ClassEnrollment.class_id == class_.id
+            )
+        )
+        if existing_enrollment:
+            return
+        db.add(models.ClassEnrollment(student_id=student_id, class_id=class_.id))
+        await db.commit()
+
+
+async def create_class(tag: str, teacher_id: int, name: str):
+    async with AsyncSessionLocal() as db:
+        class_ = models.Class(name=f"bench {tag} {name}", access_code=secrets.token_hex(3).upper(), teacher_id=teacher_id)
+        db.add(class_)
+        await db.commit()
+        return class_.id, class_.access_code
+
+
+async def create_fixtures(tag: str, students: int):
+    async with AsyncSessionLocal() as db:
+        teacher = models.User(
+            username=f"bench_{tag}_teacher", email=f"bench_{tag}_teacher@example.com", password="x",
+            role=models.UserRole.TEACHER
+        )
+        people = [
+            models.User(
+                username=f"bench_{tag}_{i}", email=f"bench_{tag}_{i}@example.com", password="x",
+                role=models.UserRole.STUDENT
+            )
+            for i in range(students)
+        ]
+        db.add_all([teacher, *people])
+        await db.flush()
+        # Classes belong to the teachers row, not the user
+        teacher_record = models.Teacher(name="Bench", email=teacher.email, hashed_password="x", user_id=teacher.id)
+        db.add(teacher_record)
+        await db.commit()
+        return teacher_record.id, people
+
+
+async def count_enrollments(class_id: int) -> int:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(
+            select(func.count()).select_from(models.ClassEnrollment).where(models.ClassEnrollment.class_id == class_id)
+        )
+
+
+async def remove_fixtures(tag: str, class_ids: list):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(models.ClassEnrollment).where(models.ClassEnrollment.class_id.in_(class_ids)))
+        await db.execute(delete(models.Class).where(models.Class.id.in_(class_ids)))
+        await db.execute(delete(models.Teacher).where(models.Teacher.email.like(f"bench_{tag}_%")))
+        await db.execute(delete(models.User).where(models.User.email.like(f"bench_{tag}_%")))
+        await db.commit()
+
+
+def report(name: str, wall: float, students: int, enrolled: int):
+    print(f"{name:>20}: {wall * 1000:9.1f} ms | {students / wall:8.0f} students/s | {enrolled} enrolled")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    tag = secrets.token_hex(4)
+    print(f"{args.students} students, {async_engine.dialect.name}")
+    teacher_id, people = await create_fixtures(tag, args.students)
+    class_ids = []
+    try:
+        # Students joining on their own, --concurrency at a time
+        class_id, access_code = await create_class(tag, teacher_id, "joins")
+        class_ids.append(class_id)
+        limit = asyncio.Semaphore(args.concurrency)
+
+        async def join(student_id):
+            async with limit:
+                await join_class(access_code, student_id)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(join(person.id) for person in people))
+        report("join_class each", time.perf_counter() - start, args.students, await count_enrollments(class_id))
+
+        # The same students as one roster
+        class_id, _ = await create_class(tag, teacher_id, "roster")
+        class_ids.append(class_id)
+        rows = [
+            {"email": person.email, "first_name": "", "last_name": "", "username": ""}
+            for person in people
+        ]
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            result = await import_roster(db, class_id, rows)
+        report("roster, existing", time.perf_counter() - start, args.students, await count_enrollments(class_id))
+        print(f"{'':>20}  {result['summary']}")
+
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            result = await import_roster(db, class_id, rows)
+        report("roster, again", time.perf_counter() - start, args.students, await count_enrollments(class_id))
+        print(f"{'':>20}  {result['summary']}")
+
+        # A roster of students without accounts yet
+        class_id, _ = await create_class(tag, teacher_id, "new")
+        class_ids.append(class_id)
+        rows = [
+            {"email": f"bench_{tag}_new_{i}@example.com", "first_name": "New", "last_name": str(i), "username": ""}
+            for i in range(args.students)
+        ]
+        start = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            result = await import_roster(db, class_id, rows)
+        report("roster, new accounts", time.perf_counter() - start, args.students, await count_enrollments(class_id))
+        print(f"{'':>20}  {result['summary']}")
+    finally:
+        await remove_fixtures(tag, class_ids)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+# benchmarks/sanitize.py
+"""Sanitizer cost for representative small and large TinyMCE posts.
+
+Compares the old per-call Cleaner construction, the prebuilt per-thread
+cleaner, and a cache hit on re-saved content.
+
+    cd litblogs && python -m benchmarks.sanitize --iterations 50
+"""
+import argparse
+import time
+
+import sanitizer
+
+SMALL_POST = (
+    '<p style="text-align: center;"><strong>Chapter 3 response</strong></p>'
+    '<p>Gatsby\'s parties show <em>how</em> wealth hides loneliness. '
+    '<span style="color: #e03e2d; font-size: 14pt;">The green light</span> '
+    'keeps coming back.</p><ul><li>Symbolism</li><li>Setting</li></ul>'
+)
+
+LARGE_ROW = (
+    '<tr><td style="background-color: #fbeeb8; font-family: Georgia;">{i}</td>'
+    '<td style="color: #236fa1; font-weight: bold; text-decoration: underline;">'
+    'Quote {i}: "So we beat on, boats against the current"</td>'
+    '<td><img src="/uploads/2/chart{i}.png" alt="chart {i}" onerror="alert(1)"></td></tr>'
+)
+LARGE_POST = (
+    '<h2 style="color: #169179;">Reading log</h2>'
+    '<table><thead><tr><th scope="col">#</th><th>Quote</th><th>Chart</th></tr></thead><tbody>'
+    + "".join(LARGE_ROW.format(i=i) for i in range(600))
+    + '</tbody></table><script>alert("x")</script>'
+)
+
+
+def per_call(content):
+    return sanitizer.build_cleaner().clean(content)
+
+
+def timed(func, content, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(content)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    for name, content in (("small", SMALL_POST), ("large", LARGE_POST)):
+        old = timed(per_call, content, args.iterations)
+        prebuilt = timed(sanitizer._clean, content, args.iterations)
+        sanitizer.sanitize_html(content)
+        cached = timed(sanitizer.sanitize_html, content, args.iterations)
+        print(
+            f"{name:>5} ({len(content) / 1024:6.1f} KiB): "
+            f"per-call {old:8.3f} ms | prebuilt {prebuilt:8.3f} ms | cache hit {cached:8.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
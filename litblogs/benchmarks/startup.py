@@ -0,0 +1,69 @@
+# benchmarks/startup.py
+"""Import-time breakdown of a worker boot, checked against the boot budget.
+
+Imports main in a fresh interpreter with -X importtime, totals the time
+spent per top-level package, and exits 1 when the whole import exceeds
+--budget or when a module meant to load lazily (boot.LAZY_MODULES) was
+imported at boot. A running worker reports its own boot phases at
+/api/health/startup.
+
+    cd litblogs && python -m benchmarks.startup --top 15
+"""
+import argparse
+import re
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+from boot import BOOT_BUDGET_SECONDS, LAZY_MODULES
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| +(\S+)$")
+
+
+def import_times(module: str) -> list:
+    """(self_us, cumulative_us, name) for every module imported by importing module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=Path(__file__).resolve().parent.parent,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            times.append((int(match.group(1)), int(match.group(2)), match.group(3)))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget", type=float, default=BOOT_BUDGET_SECONDS, help="seconds")
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total = sum(self_us for self_us, _, _ in times) / 1e6
+    by_package = Counter()
+    for self_us, _, name in times:
+        by_package[name.split(".")[0]] += self_us
+
+    print(f"import {args.module}: {total:.3f} s across {len(times)} modules (budget {args.budget:g} s)")
+    for package, self_us in by_package.most_common(args.top):
+        print(f"{package:>28}: {self_us / 1000:8.1f} ms  {self_us / 1e4 / total:5.1f}%")
+
+    imported = {name for _, _, name in times}
+    eager = [name for name in LAZY_MODULES if name in imported]
+    for name in eager:
+        print(f"FAIL {name} is imported at boot; it should load on first use")
+    if total > args.budget:
+        print(f"FAIL import took {total:.3f} s, over the {args.budget:g} s budget")
+    sys.exit(1 if eager or total > args.budget else 0)
+
+
+if __name__ == "__main__":
+    main()
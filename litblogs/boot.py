@@ -0,0 +1,50 @@
+# boot.py
+import os
+import sys
+import time
+
+# Target for a worker to import, run its startup hooks and serve a first request
+BOOT_BUDGET_SECONDS = float(os.getenv("BOOT_BUDGET_SECONDS", "2"))
+# Heavy dependencies that are imported on first use instead of at boot
+LAZY_MODULES = ("msal", "google.oauth2.id_token", "google.auth.transport.requests", "bs4", "bleach", "jose")
+
+
+class BootTimer:
+    """Seconds from main.py starting to import until each boot phase finished"""
+    PHASES = ("imported", "startup", "first_request")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def mark(self, phase: str):
+        if phase not in self.phases:
+            self.phases[phase] = time.perf_counter() - self.started
+
+    def report(self) -> dict:
+        ready = self.phases.get("first_request")
+        return {
+            **{f"{phase}_seconds": round(self.phases[phase], 3) if phase in self.phases else None for phase in self.PHASES},
+            "budget_seconds": BOOT_BUDGET_SECONDS,
+            "within_budget": ready <= BOOT_BUDGET_SECONDS if ready is not None else None,
+            "lazy_modules_loaded": {name: name in sys.modules for name in LAZY_MODULES}
+        }
+
+
+class BootTimerMiddleware:
+    """Marks the first request this worker finished serving"""
+
+    def __init__(self, app, timer: BootTimer):
+        self.app = app
+        self.timer = timer
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if scope["type"] == "http" and "first_request" not in self.timer.phases:
+            self.timer.mark("first_request")
+            report = self.timer.report()
+            if not report["within_budget"]:
+                print(f"Worker boot took {report['first_request_seconds']} s, over the {BOOT_BUDGET_SECONDS} s budget")
+
+
+boot_timer = BootTimer()
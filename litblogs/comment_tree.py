@@ -0,0 +1,98 @@
+# comment_tree.py
+from collections import defaultdict
+
+from sqlalchemy import literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+
+async def _load_descendants(db: AsyncSession, top_ids, max_depth: int):
+    """Fetch every descendant of top_ids down to max_depth levels with one recursive query"""
+    tree = select(
+        models.Comment.id,
+        literal(1).label("depth")
+    ).where(
+        models.Comment.parent_id.in_(top_ids)
+    ).cte("comment_tree", recursive=True)
+
+    tree = tree.union_all(
+        select(
+            models.Comment.id,
+            (tree.c.depth + 1).label("depth")
+        ).where(
+            models.Comment.parent_id == tree.c.id,
+            tree.c.depth < max_depth
+        )
+    )
+
+    result = await db.scalars(
+        select(models.Comment).join(
+            tree, models.Comment.id == tree.c.id
+        ).order_by(models.Comment.created_at, models.Comment.id)
+    )
+    return result.all()
+
+
+async def load_comment_trees(db: AsyncSession, top_comments, current_user_id: int, max_depth: int = 3):
+    """Build the nested comment payload for top_comments in a fixed number of queries.
+
+    Replies are nested up to max_depth levels below each top comment; comments at
+    the last level report has_more_replies instead of loading their children.
+    """
+    if not top_comments:
+        return []
+
+    top_ids = [comment.id for comment in top_comments]
+    descendants = await _load_descendants(db, top_ids, max_depth) if max_depth > 0 else []
+    comments = list(top_comments) + descendants
+    comment_ids = [comment.id for comment in comments]
+
+    # Children of each loaded comment, already in created_at order
+    children = defaultdict(list)
+    for comment in descendants:
+        children[comment.parent_id].append(comment)
+
+    liked_ids = set(
+        await db.scalars(
+            select(models.CommentLike.comment_id).where(
+                models.CommentLike.comment_id.in_(comment_ids),
+                models.CommentLike.user_id == current_user_id
+            )
+        )
+    )
+
+    users = {
+        user.id: user for user in await db.scalars(
+            select(models.User).where(
+                models.User.id.in_({comment.user_id for comment in comments})
+            )
+        )
+    }
+
+    def build(comment, depth):
+        user = users.get(comment.user_id)
+        reply_count = comment.reply_count
+        replies = [build(reply, depth + 1) for reply in children[comment.id]] if depth < max_depth else []
+        return {
+            "id": comment.id,
+            "content": comment.content,
+            "created_at": comment.created_at,
+            "updated_at": comment.updated_at,
+            "parent_id": comment.parent_id,
+            "user": {
+                "id": user.id,
+                "username": user.username,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "profile_image": user.profile_image
+            } if user else None,
+            "likes": comment.like_count,
+            "user_liked": comment.id in liked_ids,
+            "replies": replies,
+            "has_more_replies": reply_count > len(replies) if depth == max_depth else False,
+            "reply_count": reply_count,
+            "has_replies": reply_count > 0
+        }
+
+    return [build(comment, 0) for comment in top_comments]
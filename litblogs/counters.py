@@ -0,0 +1,75 @@
+# counters.py
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+
+def post_counts_update(post_id: int, likes: int = 0, comments: int = 0):
+    """UPDATE that atomically adds to a post's like/comment counters"""
+    return update(models.Blog).where(models.Blog.id == post_id).values(
+        like_count=models.Blog.like_count + likes,
+        comment_count=models.Blog.comment_count + comments
+    )
+
+
+def comment_counts_update(comment_id: int, likes: int = 0, replies: int = 0):
+    """UPDATE that atomically adds to a comment's like/reply counters"""
+    return update(models.Comment).where(models.Comment.id == comment_id).values(
+        like_count=models.Comment.like_count + likes,
+        reply_count=models.Comment.reply_count + replies
+    )
+
+
+def class_version_update(class_id: int):
+    """UPDATE that bumps a class's change version, which the feed ETags are built from"""
+    return update(models.Class).where(models.Class.id == class_id).values(
+        version=models.Class.version + 1
+    )
+
+
+def post_class_version_update(post_id: int):
+    """class_version_update for the class a post belongs to"""
+    class_id = select(models.Blog.class_id).where(models.Blog.id == post_id).scalar_subquery()
+    return update(models.Class).where(models.Class.id == class_id).values(
+        version=models.Class.version + 1
+    )
+
+
+def reconcile_counters(db: Session):
+    """Rebuild every denormalized counter from the like and comment tables"""
+    comments = models.Comment.__table__
+    replies = comments.alias("replies")
+
+    db.execute(
+        update(models.Blog).values(
+            like_count=select(func.count(models.PostLike.id)).where(
+                models.PostLike.post_id == models.Blog.id
+            ).scalar_subquery(),
+            comment_count=select(func.count(comments.c.id)).where(
+                comments.c.blog_id == models.Blog.id
+            ).scalar_subquery()
+        )
+    )
+    db.execute(
+        update(comments).values(
+            like_count=select(func.count(models.CommentLike.id)).where(
+                models.CommentLike.comment_id == comments.c.id
+            ).scalar_subquery(),
+            reply_count=select(func.count(replies.c.id)).where(
+                replies.c.parent_id == comments.c.id
+            ).scalar_subquery()
+        )
+    )
+    db.commit()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        reconcile_counters(db)
+        print("Counters rebuilt from post_likes, comment_likes and comments")
+    finally:
+        db.close()
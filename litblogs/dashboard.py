@@ -0,0 +1,143 @@
+# dashboard.py
+import os
+import threading
+from typing import Optional
+
+from cachetools import TTLCache
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import models
+
+RECENT_POSTS_PER_CLASS = 5
+# Changes the dashboard isn't told about (e.g. renamed students) show up after this
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "300"))
+DASHBOARD_CACHE_SIZE = int(os.getenv("DASHBOARD_CACHE_SIZE", "1000"))
+
+
+def _counts_by_class(db: Session, column, class_ids) -> dict:
+    rows = db.execute(
+        select(column, func.count()).where(column.in_(class_ids)).group_by(column)
+    ).all()
+    return dict(rows)
+
+
+def _recent_posts_by_class(db: Session, class_ids) -> dict:
+    # Number each class's posts newest first and keep the first few
+    ranked = select(
+        models.Blog.id,
+        models.Blog.title,
+        models.Blog.class_id,
+        models.Blog.owner_id,
+        models.Blog.created_at,
+        func.row_number().over(
+            partition_by=models.Blog.class_id,
+            order_by=(models.Blog.created_at.desc(), models.Blog.id.desc())
+        ).label("rank")
+    ).where(models.Blog.class_id.in_(class_ids)).subquery()
+
+    rows = db.execute(
+        select(ranked, models.User.first_name, models.User.last_name)
+        .join(models.User, models.User.id == ranked.c.owner_id)
+        .where(ranked.c.rank <= RECENT_POSTS_PER_CLASS)
+        .order_by(ranked.c.class_id, ranked.c.rank)
+    ).all()
+
+    recent = {}
+    for row in rows:
+        recent.setdefault(row.class_id, []).append({
+            "id": row.id,
+            "title": row.title,
+            "student_name": f"{row.first_name} {row.last_name}",
+            "created_at": row.created_at
+        })
+    return recent
+
+
+def build_teacher_dashboard(db: Session, teacher_ids) -> dict:
+    """Per-class stats and recent activity for the classes of teacher_ids (teachers.id values or a subquery of them) in four queries"""
+    classes = db.query(models.Class).filter(models.Class.teacher_id.in_(teacher_ids)).all()
+    class_ids = [class_.id for class_ in classes]
+
+    if class_ids:
+        enrollment_counts = _counts_by_class(db, models.ClassEnrollment.class_id, class_ids)
+        post_counts = _counts_by_class(db, models.Blog.class_id, class_ids)
+        recent_posts = _recent_posts_by_class(db, class_ids)
+    else:
+        enrollment_counts, post_counts, recent_posts = {}, {}, {}
+
+    classes_data = [
+        {
+            "id": class_.id,
+            "name": class_.name,
+            "description": class_.description,
+            "access_code": class_.access_code,
+            "enrollment_count": enrollment_counts.get(class_.id, 0),
+            "post_count": post_counts.get(class_.id, 0),
+            "recent_activity": recent_posts.get(class_.id, [])
+        }
+        for class_ in classes
+    ]
+    return {
+        "classes": classes_data,
+        "total_students": sum(c["enrollment_count"] for c in classes_data),
+        "total_posts": sum(c["post_count"] for c in classes_data)
+    }
+
+
+class DashboardCache:
+    """TTL + LRU cache of teacher dashboards, invalidated per class"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # class id -> teacher id of the cached dashboard that shows it
+        self._class_teachers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, teacher_id: int) -> Optional[dict]:
+        with self._lock:
+            dashboard = self._cache.get(teacher_id)
+            if dashboard is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return dashboard
+
+    def put(self, teacher_id: int, dashboard: dict):
+        with self._lock:
+            self._cache[teacher_id] = dashboard
+            for class_ in dashboard["classes"]:
+                self._class_teachers[class_["id"]] = teacher_id
+
+    def invalidate_teacher(self, teacher_id: int):
+        with self._lock:
+            if self._cache.pop(teacher_id, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_class(self, class_id: Optional[int]):
+        """Drop the cached dashboard showing class_id after its posts or enrollments change"""
+        if class_id is None:
+            return
+        with self._lock:
+            teacher_id = self._class_teachers.pop(class_id, None)
+            if teacher_id is not None and self._cache.pop(teacher_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+dashboard_cache = DashboardCache(DASHBOARD_CACHE_SIZE, DASHBOARD_CACHE_TTL)
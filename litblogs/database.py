@@ -1,17 +1,159 @@
 # database.py
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from base import Base
 
 load_dotenv()  # Load environment variables from a .env file if you use one
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# DATABASE_URL may name either a sync or an asyncio driver; the other engine
+# is derived from it so sync and async handlers always share one database
+SYNC_DRIVERS = {"postgresql": "postgresql+psycopg2", "sqlite": "sqlite"}
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def _url_for(url: str, drivers: dict):
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in drivers:
+        raise ValueError(f"Unsupported database backend: {backend}")
+    return parsed.set(drivername=drivers[backend])
+
+# Connection pool settings, tuned through the environment. The sync and
+# async engines each keep their own pool, so one worker may open up to
+# (DB_POOL_SIZE + DB_MAX_OVERFLOW) + (DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW)
+# connections; the async pool defaults to the sync pool's settings
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", str(POOL_SIZE)))
+ASYNC_POOL_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", str(POOL_MAX_OVERFLOW)))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+class PoolMetrics:
+    """Checkout wait times and in-use gauges for one engine's pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+    def on_checkout(self, *args):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def on_checkin(self, *args):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            stats = {
+                "pool_class": type(pool).__name__,
+                "checkouts": self.checkouts,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3)
+            }
+        # Queue pools also report their own size and overflow
+        if isinstance(pool, QueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+                "timeout": pool.timeout()
+            })
+        return stats
+
+def _instrumented(pool_class, metrics: PoolMetrics):
+    """Subclass pool_class so time spent waiting for a connection is recorded"""
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except PoolTimeoutError:
+                metrics.record_wait(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.record_wait(time.perf_counter() - start)
+            return connection
+
+    InstrumentedPool.__name__ = pool_class.__name__
+    return InstrumentedPool
+
+def _pool_options(url, pool_class, metrics: PoolMetrics, size: int, max_overflow: int) -> dict:
+    options = {"pool_pre_ping": POOL_PRE_PING, "pool_recycle": POOL_RECYCLE}
+    # SQLite picks its own pool types, which don't take queue settings
+    if url.get_backend_name() != "sqlite":
+        options.update({
+            "poolclass": _instrumented(pool_class, metrics),
+            "pool_size": size,
+            "max_overflow": max_overflow,
+            "pool_timeout": POOL_TIMEOUT
+        })
+    return options
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+_sync_url = _url_for(DATABASE_URL, SYNC_DRIVERS)
+engine = create_engine(
+    _sync_url, **_pool_options(_sync_url, QueuePool, sync_pool_metrics, POOL_SIZE, POOL_MAX_OVERFLOW)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_async_url = _url_for(DATABASE_URL, ASYNC_DRIVERS)
+async_engine = create_async_engine(
+    _async_url,
+    **_pool_options(_async_url, AsyncAdaptedQueuePool, async_pool_metrics, ASYNC_POOL_SIZE, ASYNC_POOL_MAX_OVERFLOW)
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+for _pool, _metrics in ((engine.pool, sync_pool_metrics), (async_engine.sync_engine.pool, async_pool_metrics)):
+    event.listen(_pool, "checkout", _metrics.on_checkout)
+    event.listen(_pool, "checkin", _metrics.on_checkin)
+
+def pool_status() -> dict:
+    """Live statistics for the sync and async connection pools"""
+    sync = sync_pool_metrics.snapshot(engine.pool)
+    async_ = async_pool_metrics.snapshot(async_engine.sync_engine.pool)
+    # What this worker can hold open at once, for sizing against the server's max_connections
+    limits = [stats["size"] + stats["max_overflow"] for stats in (sync, async_) if "size" in stats]
+    return {
+        "sync": sync,
+        "async": async_,
+        "max_connections_per_worker": sum(limits) if limits else None
+    }
+
 def get_db():
     db = SessionLocal()
     try:
@@ -19,6 +161,6 @@ def get_db():
     finally:
         db.close()
 
-def reset_database():
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,188 @@
+# events.py
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+
+from database import async_engine
+
+# Events a slow subscriber may fall behind by before it is told to resync
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "100"))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+# "local" keeps events inside this worker; "postgres" shares them via LISTEN/NOTIFY
+EVENTS_ADAPTER = os.getenv("EVENTS_ADAPTER", "local")
+# Connections the postgres adapter sends NOTIFY on, besides its listener
+EVENTS_PUBLISH_CONNECTIONS = int(os.getenv("EVENTS_PUBLISH_CONNECTIONS", "2"))
+
+
+class Subscription:
+    """One client's bounded queue of events for a class"""
+
+    def __init__(self, class_id: int, maxsize: int):
+        self.class_id = class_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def deliver(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind loses its backlog and refetches the feed instead
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync", "class_id": self.class_id})
+
+
+class EventAdapter:
+    """Carries published events to the brokers of every worker.
+
+    This base adapter only delivers within the current process; subclasses
+    forward through a shared channel and call deliver for events they receive.
+    """
+
+    async def start(self, deliver):
+        self._deliver = deliver
+
+    async def publish(self, class_id: int, event: dict):
+        self._deliver(class_id, event)
+
+    async def stop(self):
+        pass
+
+
+class PostgresNotifyAdapter(EventAdapter):
+    """Shares events between workers through Postgres LISTEN/NOTIFY.
+
+    The listening connection is kept for LISTEN alone; NOTIFYs go through a
+    small pool, since an asyncpg connection runs one query at a time.
+    """
+    CHANNEL = "litblogs_class_events"
+
+    def __init__(self, dsn: str, publish_connections: int):
+        self.dsn = dsn
+        self.publish_connections = publish_connections
+        self._connection = None
+        self._pool = None
+
+    async def start(self, deliver):
+        import asyncpg
+
+        self._deliver = deliver
+        self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.publish_connections)
+        try:
+            self._connection = await asyncpg.connect(self.dsn)
+        except Exception:
+            # The broker retries start; don't leave this attempt's pool behind
+            await self._pool.close()
+            self._pool = None
+            raise
+        # A listening session also receives its own notifications, so local
+        # subscribers are served by the same path as other workers'
+        await self._connection.add_listener(self.CHANNEL, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        self._deliver(message["class_id"], message["event"])
+
+    async def publish(self, class_id: int, event: dict):
+        payload = json.dumps({"class_id": class_id, "event": event}, default=str)
+        await self._pool.execute("SELECT pg_notify($1, $2)", self.CHANNEL, payload)
+
+    async def stop(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+class EventBroker:
+    """Per-class pub/sub for live feed updates"""
+
+    def __init__(self, adapter: EventAdapter, queue_size: int):
+        self._adapter = adapter
+        self._queue_size = queue_size
+        self._subscribers = {}
+        self._started = None
+        self.published = 0
+        self.delivered = 0
+        self.publish_errors = 0
+
+    async def start(self):
+        if self._started is None:
+            self._started = asyncio.ensure_future(self._adapter.start(self._deliver))
+        try:
+            await asyncio.shield(self._started)
+        except Exception:
+            # Let the next publish or subscriber retry the connection
+            self._started = None
+            raise
+
+    def _deliver(self, class_id: int, event: dict):
+        for subscription in list(self._subscribers.get(class_id, ())):
+            subscription.deliver(event)
+            self.delivered += 1
+
+    async def publish(self, class_id: int, event: dict):
+        """Send event to every subscriber of class_id; failures never fail the write"""
+        try:
+            await self.start()
+            await self._adapter.publish(class_id, {**event, "class_id": class_id})
+            self.published += 1
+        except Exception as e:
+            self.publish_errors += 1
+            print(f"Event publish error: {str(e)}")
+
+    @contextmanager
+    def subscribe(self, class_id: int):
+        subscription = Subscription(class_id, self._queue_size)
+        self._subscribers.setdefault(class_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            subscribers = self._subscribers.get(class_id)
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[class_id]
+
+    async def stop(self):
+        if self._started is not None:
+            await self._adapter.stop()
+            self._started = None
+
+    def stats(self) -> dict:
+        return {
+            "adapter": type(self._adapter).__name__,
+            "queue_size": self._queue_size,
+            "classes": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "publish_errors": self.publish_errors
+        }
+
+
+async def event_stream(broker: EventBroker, class_id: int, request):
+    """Server-sent events for one class, with comment heartbeats to keep proxies from timing out"""
+    await broker.start()
+    with broker.subscribe(class_id) as subscription:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=EVENT_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def create_adapter() -> EventAdapter:
+    if EVENTS_ADAPTER == "postgres":
+        url = async_engine.url.set(drivername="postgresql")
+        return PostgresNotifyAdapter(url.render_as_string(hide_password=False), EVENTS_PUBLISH_CONNECTIONS)
+    return EventAdapter()
+
+
+event_broker = EventBroker(create_adapter(), EVENT_QUEUE_SIZE)
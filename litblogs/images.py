@@ -0,0 +1,174 @@
+# images.py
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from uploads import UPLOAD_DIR
+
+# Requested widths are rounded up to one of these so each image has few variants
+DERIVATIVE_WIDTHS = (64, 128, 256, 512, 1024, 2048)
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+# Formats that may carry transparency are re-encoded as PNG, everything else as JPEG
+PNG_SOURCES = {".png", ".gif", ".webp"}
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "82"))
+
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", "image_cache"))
+IMAGE_CACHE_BYTES = int(os.getenv("IMAGE_CACHE_BYTES", str(256 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Refuse to decode anything bigger than a very large photo
+Image.MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(64 * 1024 * 1024)))
+
+# Raised for images that are served as uploaded instead of resized
+RENDER_ERRORS = (ValueError, OSError, UnidentifiedImageError, Image.DecompressionBombError)
+
+
+def derivative_width(width: int) -> int:
+    for candidate in DERIVATIVE_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return DERIVATIVE_WIDTHS[-1]
+
+
+def source_path(file_path: str) -> Optional[Path]:
+    """Uploaded image for a path relative to /uploads, or None if there is no such image"""
+    root = UPLOAD_DIR.resolve()
+    path = (root / file_path).resolve()
+    if not path.is_relative_to(root) or path.suffix.lower() not in IMAGE_EXTENSIONS or not path.is_file():
+        return None
+    return path
+
+
+def _render(source: Path, width: int, destination: Path):
+    """Write source bounded to width, re-encoded without EXIF, to destination"""
+    with Image.open(source) as image:
+        if getattr(image, "is_animated", False):
+            raise ValueError("animated images are served as uploaded")
+        # Let the JPEG decoder downscale while decoding
+        image.draft("RGB", (width, width * image.height // max(image.width, 1)))
+        icc_profile = image.info.get("icc_profile")
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+        partial = destination.with_name(destination.name + ".part")
+        if destination.suffix == ".png":
+            image.save(partial, "PNG", optimize=True, icc_profile=icc_profile)
+        else:
+            image.convert("RGB").save(
+                partial, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True, icc_profile=icc_profile
+            )
+        partial.replace(destination)
+
+
+class DerivativeCache:
+    """Disk cache of image derivatives, evicted least recently used beyond a byte budget"""
+
+    def __init__(self, directory: Path, budget: int, workers: int):
+        self.directory = directory
+        self.budget = budget
+        self._workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Derivatives being rendered, so concurrent requests share one render
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    def _load(self):
+        # Pick up derivatives from previous runs, oldest access first
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = [path for path in self.directory.iterdir() if path.is_file() and path.suffix in (".png", ".jpg")]
+        for path in sorted(files, key=lambda path: path.stat().st_atime):
+            size = path.stat().st_size
+            self._entries[path.name] = size
+            self._bytes += size
+        self._evict()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="images")
+        return self._executor
+
+    def _evict(self):
+        # Called with the lock held (or during construction)
+        while self._bytes > self.budget and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                (self.directory / name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _key(self, source: Path, width: int) -> str:
+        # Replacing the source changes its mtime/size and so its derivatives
+        stat = source.stat()
+        raw = f"{source}:{stat.st_mtime_ns}:{stat.st_size}:{width}"
+        extension = ".png" if source.suffix.lower() in PNG_SOURCES else ".jpg"
+        return hashlib.sha256(raw.encode()).hexdigest() + extension
+
+    def _lookup(self, name: str) -> Optional[Path]:
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+        return self.directory / name
+
+    def _add(self, name: str):
+        size = (self.directory / name).stat().st_size
+        with self._lock:
+            self._entries[name] = size
+            self._bytes += size
+            self._evict()
+
+    async def get(self, source: Path, width: int) -> Path:
+        """Path of the width-bounded derivative of source, rendering it on first use"""
+        name = self._key(source, width)
+        cached = self._lookup(name)
+        if cached is not None:
+            return cached
+
+        pending = self._pending.get(name)
+        if pending is None:
+            with self._lock:
+                self.misses += 1
+            pending = self._pending[name] = asyncio.ensure_future(self._generate(source, width, name))
+            pending.add_done_callback(lambda _: self._pending.pop(name, None))
+        return await asyncio.shield(pending)
+
+    async def _generate(self, source: Path, width: int, name: str) -> Path:
+        destination = self.directory / name
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._get_executor(), _render, source, width, destination)
+        self._add(name)
+        return destination
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "directory": str(self.directory),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+derivative_cache = DerivativeCache(IMAGE_CACHE_DIR, IMAGE_CACHE_BYTES, IMAGE_WORKERS)
@@ -0,0 +1,171 @@
+# likes.py
+import asyncio
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from counters import comment_counts_update, post_counts_update, post_class_version_update
+from database import AsyncSessionLocal
+
+# With a window > 0, toggles arriving within it are applied together in one
+# transaction; each request still waits for and returns its own result
+LIKE_BUFFER_MS = float(os.getenv("LIKE_BUFFER_MS", "0"))
+LIKE_BUFFER_MAX = int(os.getenv("LIKE_BUFFER_MAX", "500"))
+
+
+@dataclass(frozen=True)
+class LikeKind:
+    """Where likes of one kind of target live and which counters they move"""
+    model: type
+    target: str
+    counted: type
+    counts_update: Callable
+    # Extra UPDATE for a target whose like count changed
+    touch: Optional[Callable] = None
+
+
+POST_LIKES = LikeKind(
+    model=models.PostLike,
+    target="post_id",
+    counted=models.Blog,
+    counts_update=lambda post_id, delta: post_counts_update(post_id, likes=delta),
+    touch=post_class_version_update
+)
+COMMENT_LIKES = LikeKind(
+    model=models.CommentLike,
+    target="comment_id",
+    counted=models.Comment,
+    counts_update=lambda comment_id, delta: comment_counts_update(comment_id, likes=delta)
+)
+
+
+def insert_ignoring_conflicts(db: AsyncSession, model):
+    """INSERT ... ON CONFLICT DO NOTHING for the session's database"""
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model).on_conflict_do_nothing()
+
+
+async def apply_toggles(db: AsyncSession, kind: LikeKind, toggles: list) -> list:
+    """Apply (target_id, user_id) like toggles in order and commit.
+
+    Returns (action, like_count) per toggle. Repeated toggles by the same
+    user cancel out in memory; the net changes are one multi-row INSERT ...
+    ON CONFLICT DO NOTHING and one DELETE, so concurrent double-clicks can't
+    hit the unique constraint, and counters move only by rows really changed.
+    """
+    target = getattr(kind.model, kind.target)
+    user = kind.model.user_id
+    keys = list(dict.fromkeys(toggles))
+
+    liked = set((await db.execute(select(target, user).where(tuple_(target, user).in_(keys)))).all())
+    state = {key: key in liked for key in keys}
+    actions = []
+    for key in toggles:
+        state[key] = not state[key]
+        actions.append("liked" if state[key] else "unliked")
+
+    deltas = Counter()
+    to_insert = [key for key in keys if state[key] and key not in liked]
+    if to_insert:
+        inserted = await db.execute(
+            insert_ignoring_conflicts(db, kind.model).values(
+                [{kind.target: target_id, "user_id": user_id} for target_id, user_id in to_insert]
+            ).returning(target)
+        )
+        deltas.update(target_id for target_id, in inserted)
+    to_delete = [key for key in keys if not state[key] and key in liked]
+    if to_delete:
+        deleted = await db.execute(
+            delete(kind.model).where(tuple_(target, user).in_(to_delete)).returning(target)
+        )
+        deltas.subtract(target_id for target_id, in deleted)
+
+    # Counters that moved come back from their UPDATE; only the rest are read afterwards
+    counts = {}
+    for target_id, delta in deltas.items():
+        if delta:
+            counts[target_id] = await db.scalar(
+                kind.counts_update(target_id, delta).returning(kind.counted.like_count)
+            )
+            if kind.touch is not None:
+                await db.execute(kind.touch(target_id))
+    await db.commit()
+
+    unchanged = {target_id for target_id, _ in keys} - counts.keys()
+    if unchanged:
+        counts.update((await db.execute(
+            select(kind.counted.id, kind.counted.like_count).where(kind.counted.id.in_(unchanged))
+        )).all())
+    return [(action, counts.get(target_id)) for action, (target_id, _) in zip(actions, toggles)]
+
+
+class LikeBuffer:
+    """Like toggles for one LikeKind, optionally coalesced over a short window"""
+
+    def __init__(self, kind: LikeKind, window_ms: float, max_batch: int):
+        self.kind = kind
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+        self.toggles = 0
+        self.flushes = 0
+        self.coalesced = 0
+
+    async def toggle(self, db: AsyncSession, target_id: int, user_id: int):
+        """Toggle user_id's like of target_id; returns (action, like_count)"""
+        self.toggles += 1
+        if self.window <= 0:
+            self.flushes += 1
+            return (await apply_toggles(db, self.kind, [(target_id, user_id)]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((target_id, user_id), future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+        return await future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch: list):
+        toggles = [key for key, _ in batch]
+        self.flushes += 1
+        self.coalesced += len(toggles) - len(set(toggles))
+        try:
+            async with AsyncSessionLocal() as db:
+                results = await apply_toggles(db, self.kind, toggles)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "toggles": self.toggles,
+            "flushes": self.flushes,
+            "coalesced": self.coalesced,
+            "pending": len(self._pending)
+        }
+
+
+post_likes = LikeBuffer(POST_LIKES, LIKE_BUFFER_MS, LIKE_BUFFER_MAX)
+comment_likes = LikeBuffer(COMMENT_LIKES, LIKE_BUFFER_MS, LIKE_BUFFER_MAX)
@@ -1,38 +1,60 @@
  # main.py
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from database import engine, get_db, reset_database
-from base import Base
+# Imported first so the boot report covers every import below
+from boot import boot_timer, BootTimerMiddleware
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Query, Request
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy import text, func, select, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import engine, get_db, get_async_db, pool_status
 import models
 import schemas
-from typing import List
+from typing import List, Literal, Optional, Union
 from pydantic import BaseModel
-from passlib.context import CryptContext
+from passwords import hash_password, verify_password, hash_metrics
+from principals import Principal, principal_cache
+from dashboard import build_teacher_dashboard, dashboard_cache
+from uploads import (
+    UPLOAD_DIR, BLOB_DIR, BLOB_CACHE_CONTROL, UPLOAD_CACHE_CONTROL, UploadFiles,
+    save_upload, store_blob, release_blob, safe_filename, upload_metrics
+)
+from media import media_response, weak_etag, is_not_modified, not_modified_response
+from images import derivative_cache, derivative_width, source_path, RENDER_ERRORS
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
 import os
+import time
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
 from fastapi.security import OAuth2PasswordBearer
-import shutil
 from pathlib import Path
 import random
 import string
 from models import User, Teacher  # Add this line
-from bs4 import BeautifulSoup
-import bleach
-from bleach.css_sanitizer import CSSSanitizer
-from google.auth.transport import requests
-from google.oauth2 import id_token
+from sanitizer import sanitize_html_async
+from rich_content import blocks_from_post, has_block_fields, summarize_html
 import secrets
 import random
-from msal import ConfidentialClientApplication  # Add this import
 from sqlalchemy.orm import relationship
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from pagination import (
+    encode_cursor, keyset_before, keyset_after, InvalidCursor,
+    PageParams, page_params, paginate, build_page
+)
+from comment_tree import load_comment_trees
+from events import event_broker, event_stream
+from likes import post_likes, comment_likes
+from roster import parse_roster, import_roster
+from provisioning import provision_users
+from migrations import migrate, migration_status
+from search import (
+    search_document, document_insert, document_update, document_append_comment, document_delete,
+    local_index, search_posts
+)
+from counters import post_counts_update, comment_counts_update, class_version_update, post_class_version_update
 
 app = FastAPI()
+app.add_middleware(BootTimerMiddleware, timer=boot_timer)
 
 # Add CORS middleware
 app.add_middleware(
@@ -43,15 +65,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-    deprecated="auto",
-    bcrypt__rounds=12
-)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 class LoginRequest(BaseModel):
     email: str
     password: str
@@ -63,23 +76,16 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Create tables if they don't exist (if you already have tables, this will be a no-op)
-Base.metadata.create_all(bind=engine)
-
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
-
 # ---------- Authentication Endpoints ----------
 
 @app.post("/api/auth/register", response_model=schemas.UserResponse)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if email or username already exists
-    db_user = db.query(models.User).filter(
-        (models.User.email == user.email) | (models.User.username == user.username)
-    ).first()
+    db_user = await db.scalar(
+        select(models.User).where(
+            (models.User.email == user.email) | (models.User.username == user.username)
+        ).limit(1)
+    )
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -102,7 +108,7 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
     try:
         # Create the new user
-        hashed_password = get_password_hash(user.password)
+        hashed_password = await hash_password(user.password)
         new_user = models.User(
             username=user.username,
             email=user.email,
@@ -113,7 +119,7 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
             is_admin=(user.role == models.UserRole.ADMIN)
         )
         db.add(new_user)
-        db.flush()
+        await db.flush()
 
         # If the user is a teacher, create a Teacher record
         if user.role == models.UserRole.TEACHER:
@@ -125,8 +131,8 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
             db.add(new_teacher)
 
         # Commit all changes
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
 
         # Create access token
         access_token = create_access_token(data={"sub": str(new_user.id)})
@@ -144,41 +150,66 @@ def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         }
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error creating user: {str(e)}"
         )
 
 def create_access_token(data: dict):
+    from jose import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def teacher_record_ids(current_user: Principal):
+    """Subquery of the teachers rows belonging to a teacher user.
+
+    Classes reference teachers.id, not users.id. Teacher rows made at
+    registration have no user_id and are matched by email, as create_class does.
+    """
+    return select(models.Teacher.id).where(or_(
+        models.Teacher.user_id == current_user.id,
+        and_(models.Teacher.user_id.is_(None), models.Teacher.email == current_user.email)
+    ))
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    return await resolve_principal(token, db)
+
+async def resolve_principal(token: str, db: AsyncSession) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
+        user_id = payload.get("sub")
         if user_id is None:
             raise credentials_exception
-    except JWTError:
+        user_id = int(user_id)
+    except (JWTError, ValueError):
         raise credentials_exception
     
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+    
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     if user is None:
         raise credentials_exception
-    return user
+    principal = Principal.from_user(user)
+    principal_cache.put(principal)
+    return principal
 
 @app.post("/api/auth/login")
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == login_data.email).first()
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await db.scalar(select(models.User).where(models.User.email == login_data.email))
     
     if not user:
         raise HTTPException(
@@ -188,7 +219,8 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
     
     # Check if this is a social login account by trying to verify password
     # If password verification fails, it might be a social account
-    if not verify_password(login_data.password, user.password):
+    password_valid, new_hash = await verify_password(login_data.password, user.password)
+    if not password_valid:
         # Check if this user signed up with either Google or Microsoft
         # Since we don't have the ID fields, we need to rely on other signals
         # One approach is to tell users to use social login if password is invalid
@@ -197,19 +229,24 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
             detail="Invalid email or password. If you signed up with Google or Microsoft, please use those login methods."
         )
     
+    # Upgrade hashes made with an outdated scheme or cost
+    if new_hash:
+        user.password = new_hash
+        await db.commit()
+
     # Create access token with user ID
     access_token = create_access_token(data={"sub": str(user.id)})
 
     # Get class info for students
     class_info = None
     if user.role == models.UserRole.STUDENT:
-        enrollment = db.query(models.ClassEnrollment).filter(
-            models.ClassEnrollment.student_id == user.id
-        ).first()
+        enrollment = await db.scalar(
+            select(models.ClassEnrollment).where(
+                models.ClassEnrollment.student_id == user.id
+            ).limit(1)
+        )
         if enrollment:
-            class_ = db.query(models.Class).filter(
-                models.Class.id == enrollment.class_id
-            ).first()
+            class_ = await db.get(models.Class, enrollment.class_id)
             class_info = {
                 "id": class_.id,
                 "name": class_.name,
@@ -227,6 +264,18 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
         "is_admin": user.is_admin
     }
 
+def verify_google_token(credential: str) -> dict:
+    # google-auth is only needed by the Google sign-in routes, so it loads on first use
+    from google.auth.transport import requests
+    from google.oauth2 import id_token
+
+    return id_token.verify_oauth2_token(
+        credential,
+        requests.Request(),
+        os.getenv("GOOGLE_CLIENT_ID"),
+        clock_skew_in_seconds=30  # Increased to 30 seconds
+    )
+
 @app.post("/api/auth/google-signup")
 async def google_signup(token_data: dict, db: Session = Depends(get_db)):
     """Handle Google Sign Up"""
@@ -274,12 +323,7 @@ async def google_signup(token_data: dict, db: Session = Depends(get_db)):
 
         try:
             # First try with increased clock skew tolerance
-            idinfo = id_token.verify_oauth2_token(
-                credential,
-                requests.Request(),
-                os.getenv("GOOGLE_CLIENT_ID"),
-                clock_skew_in_seconds=30  # Increased to 30 seconds
-            )
+            idinfo = verify_google_token(credential)
         except ValueError as e:
             if "Token used too early" in str(e):
                 # If the error is about token timing, try to bypass the verification
@@ -338,7 +382,7 @@ async def google_signup(token_data: dict, db: Session = Depends(get_db)):
             username=username,
             first_name=idinfo.get('given_name', ''),
             last_name=idinfo.get('family_name', ''),
-            password=get_password_hash(secrets.token_urlsafe(32)),
+            password=await hash_password(secrets.token_urlsafe(32)),
             role=user_role  # Use the selected role
         )
         
@@ -387,12 +431,7 @@ async def google_login(token_data: dict, db: Session = Depends(get_db)):
         # Verify token with Google
         try:
             # First try with increased clock skew tolerance
-            idinfo = id_token.verify_oauth2_token(
-                token, 
-                requests.Request(), 
-                os.getenv("GOOGLE_CLIENT_ID"),
-                clock_skew_in_seconds=30  # Increased to 30 seconds
-            )
+            idinfo = verify_google_token(token)
         except ValueError as e:
             if "Token used too early" in str(e):
                 # If the error is about token timing, try to bypass the verification
@@ -536,6 +575,9 @@ MS_AUTHORITY = "https://login.microsoftonline.com/common"
 @app.post("/api/auth/microsoft-token")
 async def get_microsoft_token(request_data: dict, db: Session = Depends(get_db)):
     """Exchange authorization code for tokens and handle signup"""
+    import requests
+    from msal import ConfidentialClientApplication
+
     try:
         auth_code = request_data.get('auth_code')
         role = request_data.get('role', 'STUDENT')
@@ -599,7 +641,7 @@ async def get_microsoft_token(request_data: dict, db: Session = Depends(get_db))
             # Create new user
             username = user_data['mail'].split('@')[0] + str(random.randint(1000, 9999))
             random_password = secrets.token_hex(16)
-            hashed_password = get_password_hash(random_password)
+            hashed_password = await hash_password(random_password)
             
             user = models.User(
                 username=username,
@@ -711,7 +753,7 @@ async def microsoft_signup(microsoft_data: dict, db: Session = Depends(get_db)):
         
         # Generate a random password 
         random_password = secrets.token_hex(16)
-        hashed_password = get_password_hash(random_password)
+        hashed_password = await hash_password(random_password)
         
         # Create user with the provided role
         new_user = models.User(
@@ -756,7 +798,7 @@ async def microsoft_signup(microsoft_data: dict, db: Session = Depends(get_db)):
 async def get_user_info(
     user_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
@@ -771,15 +813,49 @@ async def get_user_info(
 
 # ---------- Blog Endpoints ----------
 
-@app.get("/api/blogs", response_model=List[schemas.BlogResponse])
-def get_blogs(db: Session = Depends(get_db)):
-    blogs = db.query(models.Blog).all()
-    return blogs
+PostListView = Literal["full", "summary"]
+
+def blog_list_columns(view: str) -> list:
+    """Columns selected by the post list endpoints; view=summary never loads content"""
+    columns = [
+        models.Blog.id,
+        models.Blog.title,
+        models.Blog.excerpt,
+        models.Blog.word_count,
+        models.Blog.reading_time,
+        models.Blog.created_at,
+        models.Blog.owner_id,
+        models.Blog.class_id,
+        models.Blog.like_count,
+        models.Blog.comment_count
+    ]
+    if view == "full":
+        columns.append(models.Blog.content)
+    return columns
+
+@app.get("/api/blogs", response_model=Union[List[schemas.BlogResponse], schemas.BlogPage])
+def get_blogs(
+    view: PostListView = "full",
+    page: PageParams = Depends(page_params),
+    db: Session = Depends(get_db)
+):
+    query = paginate(
+        db.query(*blog_list_columns(view)),
+        [models.Blog.created_at, models.Blog.id],
+        page,
+        descending=True
+    )
+    return build_page(
+        query.all(),
+        page,
+        key=lambda blog: (blog.created_at, blog.id),
+        format_item=lambda blog: blog._asdict()
+    )
 
 @app.post("/api/blogs", response_model=schemas.BlogResponse)
 def create_blog(blog: schemas.BlogCreate, owner_id: int, db: Session = Depends(get_db)):
     # In a real application, owner_id would come from the authenticated user (e.g., JWT token)
-    new_blog = models.Blog(title=blog.title, content=blog.content, owner_id=owner_id)
+    new_blog = models.Blog(title=blog.title, content=blog.content, owner_id=owner_id, **summarize_html(blog.content))
     db.add(new_blog)
     db.commit()
     db.refresh(new_blog)
@@ -790,8 +866,13 @@ def delete_blog(blog_id: int, db: Session = Depends(get_db)):
     blog = db.query(models.Blog).filter(models.Blog.id == blog_id).first()
     if not blog:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Blog not found")
+    db.execute(document_delete(blog_id))
     db.delete(blog)
+    if blog.class_id is not None:
+        db.execute(class_version_update(blog.class_id))
     db.commit()
+    local_index.remove(blog_id)
+    dashboard_cache.invalidate_class(blog.class_id)
     return {"message": "Blog deleted"}
 
 # ---------- Home Endpoint ----------
@@ -799,12 +880,54 @@ def delete_blog(blog_id: int, db: Session = Depends(get_db)):
 def home():
     return {"message": "Welcome to LitBlogs Backend"}
 
+@app.get("/api/health/passwords")
+def password_health():
+    return hash_metrics.snapshot()
+
+@app.get("/api/health/principal-cache")
+def principal_cache_health():
+    return principal_cache.stats()
+
+@app.get("/api/health/uploads")
+def upload_health():
+    return upload_metrics.snapshot()
+
+@app.get("/api/health/image-cache")
+def image_cache_health():
+    return derivative_cache.stats()
+
+@app.get("/api/health/likes")
+def likes_health():
+    return {"posts": post_likes.stats(), "comments": comment_likes.stats()}
+
+@app.get("/api/health/startup")
+def startup_health():
+    return boot_timer.report()
+
+@app.get("/api/health/migrations")
+def migrations_health():
+    return migration_status(engine)
+
+@app.get("/api/health/events")
+def events_health():
+    return event_broker.stats()
+
+@app.get("/api/health/dashboard-cache")
+def dashboard_cache_health():
+    return dashboard_cache.stats()
+
 @app.get("/api/test-db")
+@app.get("/api/health/db")
 def test_db(db: Session = Depends(get_db)):
     try:
-        # Execute a simple query
+        # Execute a simple query and time the round trip
+        start = time.perf_counter()
         result = db.execute(text("SELECT 1"))
-        return {"message": "Successfully connected to the database!"}
+        return {
+            "message": "Successfully connected to the database!",
+            "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+            "pools": pool_status()
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
 
@@ -827,25 +950,32 @@ def verify_admin_code(code_data: dict):
 async def update_role(
     role_data: dict, 
     db: Session = Depends(get_db), 
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
-    user = db.query(models.User).filter(models.User.id == current_user.id).first()
-    user.role = role_data["role"]
+    db.query(models.User).filter(models.User.id == current_user.id).update(
+        {models.User.role: role_data["role"]}, synchronize_session=False
+    )
     
     if role_data["role"] == models.UserRole.STUDENT and "classCode" in role_data:
         class_ = db.query(models.Class).filter(models.Class.access_code == role_data["classCode"]).first()
-        if class_:
-            enrollment = models.ClassEnrollment(student_id=user.id, class_id=class_.id)
+        if class_ and not db.query(models.ClassEnrollment.id).filter(
+            models.ClassEnrollment.student_id == current_user.id,
+            models.ClassEnrollment.class_id == class_.id
+        ).first():
+            enrollment = models.ClassEnrollment(student_id=current_user.id, class_id=class_.id)
             db.add(enrollment)
     
     db.commit()
+    principal_cache.invalidate(current_user.id)
+    if role_data["role"] == models.UserRole.STUDENT and "classCode" in role_data and class_:
+        dashboard_cache.invalidate_class(class_.id)
     return {"message": "Role updated successfully"}
 
 @app.get("/api/classes/{class_id}/details")
 async def get_class_details(
     class_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Get the class details
     class_details = db.query(models.Class).filter(models.Class.id == class_id).first()
@@ -855,7 +985,10 @@ async def get_class_details(
     # Check if user has access to this class
     if current_user.role == models.UserRole.TEACHER:
         # Teachers can access classes they created
-        if class_details.teacher_id != current_user.id:
+        if not db.scalar(select(models.Class.id).where(
+            models.Class.id == class_id,
+            models.Class.teacher_id.in_(teacher_record_ids(current_user))
+        )):
             raise HTTPException(status_code=403, detail="Not authorized to access this class")
     elif current_user.role == models.UserRole.STUDENT:
         # Students can access classes they're enrolled in
@@ -868,8 +1001,11 @@ async def get_class_details(
     else:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    # Get the teacher info
-    teacher = db.query(models.User).filter(models.User.id == class_details.teacher_id).first()
+    # Get the teacher info; classes point at the teachers row, not the user
+    teacher = db.query(models.User).join(models.Teacher, or_(
+        models.Teacher.user_id == models.User.id,
+        and_(models.Teacher.user_id.is_(None), models.Teacher.email == models.User.email)
+    )).filter(models.Teacher.id == class_details.teacher_id).first()
 
     # Get enrollment count
     enrollment_count = db.query(models.ClassEnrollment).filter(
@@ -899,174 +1035,265 @@ class PostContent(BaseModel):
     polls: List[dict] = []
     expandable_lists: List[dict] = []
 
-def sanitize_html(content: str) -> str:
-    # Define allowed tags and attributes
-    ALLOWED_TAGS = [
-        'p', 'div', 'span', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'strong', 'em', 'u', 'strike', 'br', 'ul', 'ol', 'li',
-        'blockquote', 'pre', 'code', 'hr', 'a', 'img', 'table',
-        'thead', 'tbody', 'tr', 'th', 'td', 'style', 'b', 'i', 's',
-        'font', 'mark', 'del'
-    ]
-    
-    ALLOWED_ATTRIBUTES = {
-        '*': ['class', 'style', 'id', 'data-mce-style'],
-        'a': ['href', 'title', 'target'],
-        'img': ['src', 'alt', 'title'],
-        'td': ['colspan', 'rowspan'],
-        'th': ['colspan', 'rowspan', 'scope'],
-        'font': ['color', 'size', 'face'],
-        'p': ['align', 'style'],
-        'div': ['align', 'style'],
-        'span': ['style'],
-        'h1': ['style'],
-        'h2': ['style'],
-        'h3': ['style'],
-        'h4': ['style'],
-        'h5': ['style'],
-        'h6': ['style']
-    }
-    
-    # Define allowed CSS properties
-    ALLOWED_STYLES = [
-        'color', 'background-color', 'font-size', 'text-align', 
-        'font-family', 'font-weight', 'font-style', 'text-decoration'
-    ]
-    
-    # Create a CSS sanitizer with allowed styles
-    css_sanitizer = CSSSanitizer(allowed_css_properties=ALLOWED_STYLES)
-    
-    # Create a Bleach cleaner with the allowed tags, attributes, and CSS sanitizer
-    cleaner = bleach.Cleaner(
-        tags=ALLOWED_TAGS,
-        attributes=ALLOWED_ATTRIBUTES,
-        css_sanitizer=css_sanitizer,
-        strip=False  # Don't strip tags that aren't in the whitelist
-    )
-    
-    # Sanitize the content
-    sanitized_content = cleaner.clean(content)
-    
-    return sanitized_content
-
-@app.post("/api/classes/{class_id}/posts", response_model=schemas.BlogResponse)
+@app.post("/api/classes/{class_id}/posts", response_model=schemas.BlogDetailResponse)
 async def create_class_post(
     class_id: int,
     post: schemas.BlogCreate,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Verify user has access to this class
     if current_user.role == models.UserRole.STUDENT:
-        enrollment = db.query(models.ClassEnrollment).filter(
-            models.ClassEnrollment.student_id == current_user.id,
-            models.ClassEnrollment.class_id == class_id
-        ).first()
+        enrollment = await db.scalar(
+            select(models.ClassEnrollment).where(
+                models.ClassEnrollment.student_id == current_user.id,
+                models.ClassEnrollment.class_id == class_id
+            ).limit(1)
+        )
         if not enrollment:
             raise HTTPException(status_code=403, detail="Not enrolled in this class")
     
     # Sanitize the content while preserving styles
-    content = sanitize_html(post.content)
-    
-    # Process rich content markers
-    if post.code_snippets:
-        for snippet in post.code_snippets:
-            content += f"\n[CODE:{snippet['language']}]{snippet['code']}\n"
-    
-    # Handle media (images, GIFs) if they exist
-    if post.media:
-        for media in post.media:
-            if media['type'] == 'gif':
-                content += f"\n[GIF:{media['url']}]\n"
-            elif media['type'] == 'image':
-                content += f"\n[IMAGE:{media['url']}]\n"
-    
-    # Handle polls if they exist
-    if post.polls:
-        for poll in post.polls:
-            options = ','.join(poll['options'])
-            content += f"\n[POLL:{options}]\n"
-    
-    # Handle files if they exist
-    if post.files:
-        for file in post.files:
-            content += f"\n[FILE:{file['name']}|{file['url']}]\n"
+    content = await sanitize_html_async(post.content)
+    
+    # Code snippets, media, polls and files are stored as typed blocks
+    # next to the HTML instead of being appended to it as markers
+    blocks = blocks_from_post(post)
     
     # Create new post with processed content
     new_post = models.Blog(
         title=post.title,
         content=content,
+        blocks=blocks or None,
         owner_id=current_user.id,
-        class_id=class_id
+        class_id=class_id,
+        **summarize_html(content)
     )
     
     db.add(new_post)
-    db.commit()
-    db.refresh(new_post)
+    await db.flush()
+    document = search_document(new_post.id, class_id, new_post.title, content)
+    await db.execute(document_insert(document))
+    await db.execute(class_version_update(class_id))
+    await db.commit()
+    await db.refresh(new_post)
+    local_index.put(document)
+    dashboard_cache.invalidate_class(class_id)
+    await event_broker.publish(class_id, {
+        "type": "post.created",
+        "post_id": new_post.id,
+        "title": new_post.title,
+        "author": f"{current_user.first_name} {current_user.last_name}",
+        "created_at": new_post.created_at
+    })
     
     return {
         "id": new_post.id,
         "title": new_post.title,
         "content": new_post.content,
+        "excerpt": new_post.excerpt,
+        "word_count": new_post.word_count,
+        "reading_time": new_post.reading_time,
         "created_at": new_post.created_at,
         "owner_id": new_post.owner_id,
         "class_id": new_post.class_id,
         "author": f"{current_user.first_name} {current_user.last_name}",
-        "likes": len(new_post.likes) if hasattr(new_post, 'likes') else 0,
-        "comments": len(new_post.comments) if hasattr(new_post, 'comments') else 0
+        "likes": new_post.like_count,
+        "comments": new_post.comment_count,
+        "blocks": blocks or None
     }
 
+async def class_etag(db: AsyncSession, class_id: int, request: Request) -> str:
+    """Weak ETag for a class read endpoint: the class's change version plus the request URL"""
+    version = await db.scalar(select(models.Class.version).where(models.Class.id == class_id))
+    return weak_etag(class_id, version or 0, request.url.path, request.url.query)
+
+def etag_headers(etag: str) -> dict:
+    # Browsers keep the response but revalidate it on every poll
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+@app.get("/api/classes/{class_id}/events")
+async def get_class_events(
+    class_id: int,
+    request: Request,
+    access_token: str = Query(...),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Live post/comment/like events for a class as server-sent events.
+
+    EventSource can't send an Authorization header, so the token is passed
+    as the access_token query parameter.
+    """
+    current_user = await resolve_principal(access_token, db)
+    if current_user.role == models.UserRole.STUDENT:
+        enrollment = await db.scalar(
+            select(models.ClassEnrollment).where(
+                models.ClassEnrollment.student_id == current_user.id,
+                models.ClassEnrollment.class_id == class_id
+            ).limit(1)
+        )
+        if not enrollment:
+            raise HTTPException(status_code=403, detail="Not enrolled in this class")
+    # Don't hold a pooled connection for the life of the stream
+    await db.close()
+    
+    return StreamingResponse(
+        event_stream(event_broker, class_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/classes/{class_id}/posts")
 async def get_class_posts(
     class_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    view: PostListView = "full",
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
+    """Get the class feed; pass limit (and the returned next_cursor) to page through it"""
     # Check if user has access to this class
     if current_user.role == models.UserRole.STUDENT:
-        enrollment = db.query(models.ClassEnrollment).filter(
-            models.ClassEnrollment.student_id == current_user.id,
-            models.ClassEnrollment.class_id == class_id
-        ).first()
+        enrollment = await db.scalar(
+            select(models.ClassEnrollment).where(
+                models.ClassEnrollment.student_id == current_user.id,
+                models.ClassEnrollment.class_id == class_id
+            ).limit(1)
+        )
         if not enrollment:
             raise HTTPException(status_code=403, detail="Not enrolled in this class")
     
-    # Get posts with author information
-    posts = db.query(models.Blog).filter(
+    # Polling clients get a 304 while nothing in the class has changed
+    etag = await class_etag(db, class_id, request)
+    if is_not_modified(request.headers, {"etag": etag}):
+        return not_modified_response(etag_headers(etag))
+    
+    # Posts, author names and counts in a single query
+    query = select(
+        *blog_list_columns(view),
+        models.User.id.label("author_id"),
+        models.User.first_name,
+        models.User.last_name,
+        models.Blog.blocks.isnot(None).label("has_blocks")
+    ).outerjoin(
+        models.User, models.User.id == models.Blog.owner_id
+    ).where(
         models.Blog.class_id == class_id
-    ).order_by(models.Blog.created_at.desc()).all()
+    ).order_by(models.Blog.created_at.desc(), models.Blog.id.desc())
+    
+    if cursor:
+        try:
+            query = query.where(keyset_before(models.Blog.created_at, models.Blog.id, cursor))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # Fetch one extra row to know whether there is another page
+    if limit:
+        query = query.limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    has_more = limit is not None and len(rows) > limit
+    if has_more:
+        rows = rows[:limit]
     
-    # Format posts with author information
     formatted_posts = []
-    for post in posts:
-        author = db.query(models.User).filter(models.User.id == post.owner_id).first()
-        formatted_posts.append({
-            "id": post.id,
-            "title": post.title,
-            "content": post.content,  # Whitespace will be preserved
-            "created_at": post.created_at,
-            "author": f"{author.first_name} {author.last_name}" if author else "Unknown Author",
-            "likes": len(post.likes) if hasattr(post, 'likes') else 0,
-            "comments": len(post.comments) if hasattr(post, 'comments') else 0
-        })
+    for row in rows:
+        formatted_post = {
+            "id": row.id,
+            "title": row.title,
+            "excerpt": row.excerpt,
+            "word_count": row.word_count,
+            "reading_time": row.reading_time,
+            "created_at": row.created_at,
+            "author": f"{row.first_name} {row.last_name}" if row.author_id is not None else "Unknown Author",
+            "likes": row.like_count,
+            "comments": row.comment_count,
+            "has_blocks": row.has_blocks  # Fetch them from /blocks when needed
+        }
+        if view == "full":
+            formatted_post["content"] = row.content  # Whitespace will be preserved
+        formatted_posts.append(formatted_post)
+    
+    # Without paging parameters keep returning the plain list the frontend expects
+    if limit is None and cursor is None:
+        return JSONResponse(jsonable_encoder(formatted_posts), headers=etag_headers(etag))
+    
+    return JSONResponse(jsonable_encoder({
+        "posts": formatted_posts,
+        "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    }), headers=etag_headers(etag))
+
+@app.get("/api/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    class_id: Optional[int] = None,
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Search post titles, text and comments in one class or in all of the user's classes"""
+    if class_id is not None:
+        if current_user.role == models.UserRole.STUDENT:
+            enrollment = await db.scalar(
+                select(models.ClassEnrollment).where(
+                    models.ClassEnrollment.student_id == current_user.id,
+                    models.ClassEnrollment.class_id == class_id
+                ).limit(1)
+            )
+            if not enrollment:
+                raise HTTPException(status_code=403, detail="Not enrolled in this class")
+        elif current_user.role == models.UserRole.TEACHER and not current_user.is_admin:
+            owned = await db.scalar(
+                select(models.Class.id).where(
+                    models.Class.id == class_id,
+                    models.Class.teacher_id.in_(teacher_record_ids(current_user))
+                )
+            )
+            if owned is None:
+                raise HTTPException(status_code=403, detail="Not authorized to access this class")
+        scope = select(models.Class.id).where(models.Class.id == class_id)
+    elif current_user.role == models.UserRole.STUDENT:
+        scope = select(models.ClassEnrollment.class_id).where(
+            models.ClassEnrollment.student_id == current_user.id
+        )
+    elif current_user.role == models.UserRole.TEACHER:
+        scope = select(models.Class.id).where(models.Class.teacher_id.in_(teacher_record_ids(current_user)))
+    elif current_user.is_admin:
+        scope = select(models.Class.id)
+    else:
+        raise HTTPException(status_code=403, detail="Not authorized")
     
-    return formatted_posts
+    return await search_posts(db, q, scope, page)
 
 @app.get("/api/users")
 async def get_users(
+    page: PageParams = Depends(page_params),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    
+    users = paginate(db.query(models.User), [models.User.id], page).all()
+    return build_page(users, page, key=lambda user: (user.id,), format_item=lambda user: user)
+
+@app.post("/api/admin/users/bulk")
+async def provision_user_batch(
+    batch: schemas.UserProvisionBatch,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
+    """Create many accounts at once; returns per-row results and throughput"""
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    users = db.query(models.User).all()
-    return users
+    return await provision_users(db, [user.model_dump() for user in batch.users])
 
 @app.get("/api/classes")
 async def get_classes(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Allow both admin and teacher access
     if not (current_user.is_admin or current_user.role == models.UserRole.TEACHER):
@@ -1075,7 +1302,7 @@ async def get_classes(
     # For teachers, only return their classes
     if current_user.role == models.UserRole.TEACHER:
         classes = db.query(models.Class).filter(
-            models.Class.teacher_id == current_user.id
+            models.Class.teacher_id.in_(teacher_record_ids(current_user))
         ).all()
     else:  # For admins, return all classes
         classes = db.query(models.Class).all()
@@ -1094,7 +1321,6 @@ async def debug_classes(db: Session = Depends(get_db)):
     return [{"id": c.id, "name": c.name, "access_code": c.access_code} for c in classes]
 
 # Create upload directories if they don't exist
-UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 (UPLOAD_DIR / "images").mkdir(exist_ok=True)
 (UPLOAD_DIR / "videos").mkdir(exist_ok=True)
@@ -1102,66 +1328,68 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 
 # Add these new endpoints
 @app.post("/api/upload/image")
-async def upload_image(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
+async def upload_image(
+    file: UploadFile = File(...),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
-        file_path = UPLOAD_DIR / "images" / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"url": f"/uploads/images/{file.filename}"}
+        stored = await store_blob(db, file, "image", current_user.id)
+        return {"url": stored.url, "sha256": stored.sha256, "deduplicated": stored.deduplicated}
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/upload/video")
-async def upload_video(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
+async def upload_video(
+    file: UploadFile = File(...),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
-        file_path = UPLOAD_DIR / "videos" / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"url": f"/uploads/videos/{file.filename}"}
+        stored = await store_blob(db, file, "video", current_user.id)
+        return {"url": stored.url, "sha256": stored.sha256, "deduplicated": stored.deduplicated}
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/upload/file")
-async def upload_file(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
+async def upload_file(
+    file: UploadFile = File(...),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     try:
-        file_path = UPLOAD_DIR / "files" / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        return {"url": f"/uploads/files/{file.filename}"}
+        stored = await store_blob(db, file, "file", current_user.id)
+        return {"url": stored.url, "sha256": stored.sha256, "deduplicated": stored.deduplicated}
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/upload")
 async def upload_file(
     file: UploadFile = File(...),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload a file and return its URL"""
     try:
-        # Create uploads directory if it doesn't exist
-        upload_dir = Path("uploads")
-        user_dir = upload_dir / str(current_user.id)
-        user_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Generate a unique filename
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        random_str = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-        filename = f"{timestamp}_{random_str}_{file.filename}"
-        
-        # Save the file
-        file_path = user_dir / filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # Return the file URL
-        file_url = f"/uploads/{current_user.id}/{filename}"
+        # Identical content is stored once; re-uploads only record a reference
+        stored = await store_blob(db, file, "file", current_user.id)
         
         return {
-            "url": file_url,
+            "url": stored.url,
             "filename": file.filename,
-            "size": os.path.getsize(file_path)
+            "size": stored.size,
+            "sha256": stored.sha256,
+            "deduplicated": stored.deduplicated
         }
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         print(f"File upload error: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1171,62 +1399,24 @@ async def upload_file(
 @app.get("/api/teacher/dashboard")
 async def get_teacher_dashboard(
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get teacher dashboard data"""
     if current_user.role != models.UserRole.TEACHER:
         raise HTTPException(status_code=403, detail="Not a teacher")
     
     try:
-        # Get classes taught by this teacher
-        classes = db.query(models.Class).filter(
-            models.Class.teacher_id == current_user.id
-        ).all()
-        
-        classes_data = []
-        for class_ in classes:
-            # Count enrollments for this class
-            enrollment_count = db.query(models.ClassEnrollment).filter(
-                models.ClassEnrollment.class_id == class_.id
-            ).count()
-            
-            # Count posts in this class
-            post_count = db.query(models.Blog).filter(
-                models.Blog.class_id == class_.id
-            ).count()
-            
-            # Get recent activity for this class
-            recent_posts = db.query(models.Blog).filter(
-                models.Blog.class_id == class_.id
-            ).order_by(models.Blog.created_at.desc()).limit(5).all()
-            
-            recent_activity = []
-            for post in recent_posts:
-                student = db.query(models.User).filter(models.User.id == post.owner_id).first()
-                if student:
-                    recent_activity.append({
-                        "id": post.id,
-                        "title": post.title,
-                        "student_name": f"{student.first_name} {student.last_name}",
-                        "created_at": post.created_at
-                    })
-            
-            classes_data.append({
-                "id": class_.id,
-                "name": class_.name,
-                "description": class_.description,
-                "access_code": class_.access_code,
-                "enrollment_count": enrollment_count,
-                "post_count": post_count,
-                "recent_activity": recent_activity
-            })
+        # Class stats come from grouped queries and are cached per teacher
+        # until a post or enrollment in one of their classes changes
+        dashboard = dashboard_cache.get(current_user.id)
+        if dashboard is None:
+            dashboard = build_teacher_dashboard(db, teacher_record_ids(current_user))
+            dashboard_cache.put(current_user.id, dashboard)
         
         return {
             "name": f"{current_user.first_name} {current_user.last_name}",
             "email": current_user.email,
-            "classes": classes_data,
-            "total_students": sum(c["enrollment_count"] for c in classes_data),
-            "total_posts": sum(c["post_count"] for c in classes_data)
+            **dashboard
         }
         
     except Exception as e:
@@ -1240,7 +1430,7 @@ async def get_teacher_dashboard(
 async def create_class(
     class_data: dict,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Create a new class (for teachers)"""
     if current_user.role != models.UserRole.TEACHER:
@@ -1280,6 +1470,7 @@ async def create_class(
         db.add(new_class)
         db.commit()
         db.refresh(new_class)
+        dashboard_cache.invalidate_teacher(current_user.id)
         
         return {
             "id": new_class.id,
@@ -1302,31 +1493,42 @@ async def create_class(
 async def get_class_post(
     class_id: int,
     post_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    include_blocks: bool = True,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     # Check access rights
     if current_user.role == models.UserRole.STUDENT:
-        enrollment = db.query(models.ClassEnrollment).filter(
-            models.ClassEnrollment.student_id == current_user.id,
-            models.ClassEnrollment.class_id == class_id
-        ).first()
+        enrollment = await db.scalar(
+            select(models.ClassEnrollment).where(
+                models.ClassEnrollment.student_id == current_user.id,
+                models.ClassEnrollment.class_id == class_id
+            ).limit(1)
+        )
         if not enrollment:
             raise HTTPException(status_code=403, detail="Not enrolled in this class")
     
-    post = db.query(models.Blog).filter(
+    etag = await class_etag(db, class_id, request)
+    if is_not_modified(request.headers, {"etag": etag}):
+        return not_modified_response(etag_headers(etag))
+    
+    query = select(models.Blog).where(
         models.Blog.id == post_id,
         models.Blog.class_id == class_id
-    ).first()
+    )
+    if include_blocks:
+        query = query.options(undefer(models.Blog.blocks))
+    post = await db.scalar(query)
     
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Get the author's information
-    author = db.query(models.User).filter(models.User.id == post.owner_id).first()
+    author = await db.get(models.User, post.owner_id)
     
     # Return post with author info and content
-    return {
+    return JSONResponse(jsonable_encoder({
         **post.__dict__,
         "author": {
             "id": author.id,
@@ -1334,7 +1536,37 @@ async def get_class_post(
             "last_name": author.last_name
         },
         "content": post.content  # Content already includes the markers
-    }
+    }), headers=etag_headers(etag))
+
+@app.get("/api/classes/{class_id}/posts/{post_id}/blocks")
+async def get_class_post_blocks(
+    class_id: int,
+    post_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Get the code/media/poll/file blocks of a post, for list views that omit them"""
+    if current_user.role == models.UserRole.STUDENT:
+        enrollment = await db.scalar(
+            select(models.ClassEnrollment).where(
+                models.ClassEnrollment.student_id == current_user.id,
+                models.ClassEnrollment.class_id == class_id
+            ).limit(1)
+        )
+        if not enrollment:
+            raise HTTPException(status_code=403, detail="Not enrolled in this class")
+    
+    row = (await db.execute(
+        select(models.Blog.id, models.Blog.blocks).where(
+            models.Blog.id == post_id,
+            models.Blog.class_id == class_id
+        )
+    )).first()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    return {"post_id": row.id, "blocks": row.blocks or []}
 
 @app.put("/api/classes/{class_id}/posts/{post_id}")
 async def update_class_post(
@@ -1342,7 +1574,7 @@ async def update_class_post(
     post_id: int,
     post: schemas.BlogCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Get the post
     db_post = db.query(models.Blog).filter(
@@ -1360,22 +1592,35 @@ async def update_class_post(
     # Update the post - make sure title and content are both updated
     db_post.title = post.title
     db_post.content = post.content
+    for field, value in summarize_html(post.content).items():
+        setattr(db_post, field, value)
+    if has_block_fields(post):
+        db_post.blocks = blocks_from_post(post) or None
     db_post.updated_at = datetime.utcnow()
+    document = search_document(db_post.id, class_id, post.title, post.content)
+    db.execute(document_update(document))
+    db.execute(class_version_update(class_id))
     
     db.commit()
     db.refresh(db_post)
+    local_index.put(document)
+    dashboard_cache.invalidate_class(class_id)
     
     # Return updated post
     return {
         "id": db_post.id,
         "title": db_post.title,  # Make sure title is returned
         "content": db_post.content,
+        "excerpt": db_post.excerpt,
+        "word_count": db_post.word_count,
+        "reading_time": db_post.reading_time,
         "created_at": db_post.created_at,
         "owner_id": db_post.owner_id,
         "class_id": db_post.class_id,
         "author": f"{current_user.first_name} {current_user.last_name}",
-        "likes": len(db_post.likes) if hasattr(db_post, 'likes') else 0,
-        "comments": len(db_post.comments) if hasattr(db_post, 'comments') else 0
+        "likes": db_post.like_count,
+        "comments": db_post.comment_count,
+        "blocks": db_post.blocks
     }
 
 @app.delete("/api/classes/{class_id}/posts/{post_id}")
@@ -1383,7 +1628,7 @@ async def delete_class_post(
     class_id: int,
     post_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     # Get the post
     post = db.query(models.Blog).filter(
@@ -1399,15 +1644,26 @@ async def delete_class_post(
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
     
     # Delete the post
+    db.execute(document_delete(post_id))
     db.delete(post)
+    db.execute(class_version_update(class_id))
     db.commit()
+    local_index.remove(post_id)
+    dashboard_cache.invalidate_class(class_id)
     
     return {"message": "Post deleted successfully"}
 
-# Add this before your app starts
+# Bring the schema up to date before serving; already-applied steps are skipped
 @app.on_event("startup")
 async def startup_event():
-    reset_database()
+    applied = migrate(engine)
+    if applied:
+        print(f"Applied migrations: {', '.join(applied)}")
+    boot_timer.mark("startup")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await event_broker.stop()
 
 def generate_unique_code(db: Session, length: int = 6) -> str:
     while True:
@@ -1420,34 +1676,40 @@ def generate_unique_code(db: Session, length: int = 6) -> str:
 
 @app.get("/api/student/classes")
 async def get_student_classes(
+    page: PageParams = Depends(page_params),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != models.UserRole.STUDENT:
         raise HTTPException(status_code=403, detail="Not a student")
     
-    enrollments = db.query(models.ClassEnrollment).filter(
+    # Enrolled classes with their teacher's name in one query
+    query = db.query(
+        models.Class.id,
+        models.Class.name,
+        models.Class.description,
+        models.Teacher.name.label("teacher_name")
+    ).join(
+        models.ClassEnrollment, models.ClassEnrollment.class_id == models.Class.id
+    ).outerjoin(
+        models.Teacher, models.Teacher.id == models.Class.teacher_id
+    ).filter(
         models.ClassEnrollment.student_id == current_user.id
-    ).all()
-    
-    classes = []
-    for enrollment in enrollments:
-        class_ = db.query(models.Class).filter(models.Class.id == enrollment.class_id).first()
-        teacher = db.query(models.Teacher).filter(models.Teacher.id == class_.teacher_id).first()
-        classes.append({
-            "id": class_.id,
-            "name": class_.name,
-            "description": class_.description,
-            "teacher_name": teacher.name
-        })
+    )
+    classes = paginate(query, [models.ClassEnrollment.class_id], page).all()
     
-    return classes
+    return build_page(
+        classes,
+        page,
+        key=lambda class_: (class_.id,),
+        format_item=lambda class_: class_._asdict()
+    )
 
 @app.post("/api/student/join-class")
 async def join_class(
     class_data: dict,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != models.UserRole.STUDENT:
         raise HTTPException(status_code=403, detail="Not a student")
@@ -1474,39 +1736,52 @@ async def join_class(
     )
     
     db.add(enrollment)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # A roster import or another request enrolled them since the check
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Already enrolled in this class")
+    dashboard_cache.invalidate_class(class_.id)
     
     return {"message": "Successfully joined class"}
 
 @app.get("/api/student/posts")
 async def get_student_posts(
+    view: PostListView = "full",
+    page: PageParams = Depends(page_params),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if current_user.role != models.UserRole.STUDENT:
         raise HTTPException(status_code=403, detail="Not a student")
     
-    # Get all posts by the student
-    posts = db.query(models.Blog).filter(
+    # Get the student's posts, with their class name
+    query = db.query(
+        *blog_list_columns(view),
+        models.Class.name.label("class_name")
+    ).outerjoin(
+        models.Class, models.Class.id == models.Blog.class_id
+    ).filter(
         models.Blog.owner_id == current_user.id
-    ).order_by(models.Blog.created_at.desc()).all()
-    
-    # Add class information to each post
-    posts_with_class = []
-    for post in posts:
-        class_ = db.query(models.Class).filter(models.Class.id == post.class_id).first()
-        posts_with_class.append({
-            **post.__dict__,
-            "class_name": class_.name if class_ else "Unknown Class"
-        })
-    
-    return posts_with_class
+    )
+    posts = paginate(query, [models.Blog.created_at, models.Blog.id], page, descending=True).all()
+    
+    return build_page(
+        posts,
+        page,
+        key=lambda post: (post.created_at, post.id),
+        format_item=lambda post: {
+            **post._asdict(),
+            "class_name": post.class_name or "Unknown Class"
+        }
+    )
 
 @app.get("/api/debug/post/{post_id}")
 async def debug_post_content(
     post_id: int,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
@@ -1524,96 +1799,95 @@ async def debug_post_content(
 async def update_profile(
     profile_data: dict,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Update user profile information"""
     try:
-        # Get the user from database
-        user = db.query(models.User).filter(models.User.id == current_user.id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Update fields that are present in the request
-        if "bio" in profile_data:
-            user.bio = profile_data["bio"]
-        
-        # Update name fields if provided
-        if "first_name" in profile_data:
-            user.first_name = profile_data["first_name"]
-        if "last_name" in profile_data:
-            user.last_name = profile_data["last_name"]
-            
-        db.commit()
+        updates = {
+            field: profile_data[field]
+            for field in ("bio", "first_name", "last_name")
+            if field in profile_data
+        }
+        
+        if updates:
+            updated = db.query(models.User).filter(models.User.id == current_user.id).update(
+                updates, synchronize_session=False
+            )
+            if not updated:
+                raise HTTPException(status_code=404, detail="User not found")
+            db.commit()
+            principal_cache.invalidate(current_user.id)
         
         return {"message": "Profile updated successfully"}
     except Exception as e:
         db.rollback()
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Failed to update profile: {str(e)}")
 
 @app.post("/api/user/upload-profile-image")
 async def upload_profile_image(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Upload profile image"""
     try:
-        # Create directory if it doesn't exist
-        upload_dir = Path("uploads/profile_images")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
         # Generate unique filename
-        file_extension = file.filename.split(".")[-1]
+        file_extension = safe_filename(file.filename).split(".")[-1]
         unique_filename = f"{current_user.id}_{int(datetime.now().timestamp())}.{file_extension}"
-        file_path = upload_dir / unique_filename
         
         # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await save_upload(file, UPLOAD_DIR / "profile_images" / unique_filename, "avatar")
         
         # Update user record in database
-        user = db.query(models.User).filter(models.User.id == current_user.id).first()
-        user.profile_image = f"/uploads/profile_images/{unique_filename}"
+        image_url = f"/uploads/profile_images/{unique_filename}"
+        db.query(models.User).filter(models.User.id == current_user.id).update(
+            {models.User.profile_image: image_url}, synchronize_session=False
+        )
         db.commit()
+        principal_cache.invalidate(current_user.id)
         
-        return {"image_url": user.profile_image}
+        return {"image_url": image_url}
     except Exception as e:
         db.rollback()
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
 @app.post("/api/user/upload-cover-image")
 async def upload_cover_image(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Upload cover image"""
     try:
-        # Create directory if it doesn't exist
-        upload_dir = Path("uploads/cover_images")
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
         # Generate unique filename
-        file_extension = file.filename.split(".")[-1]
+        file_extension = safe_filename(file.filename).split(".")[-1]
         unique_filename = f"{current_user.id}_{int(datetime.now().timestamp())}.{file_extension}"
-        file_path = upload_dir / unique_filename
         
         # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await save_upload(file, UPLOAD_DIR / "cover_images" / unique_filename, "avatar")
         
         # Update user record in database
-        user = db.query(models.User).filter(models.User.id == current_user.id).first()
-        user.cover_image = f"/uploads/cover_images/{unique_filename}"
+        image_url = f"/uploads/cover_images/{unique_filename}"
+        db.query(models.User).filter(models.User.id == current_user.id).update(
+            {models.User.cover_image: image_url}, synchronize_session=False
+        )
         db.commit()
+        principal_cache.invalidate(current_user.id)
         
-        return {"image_url": user.cover_image}
+        return {"image_url": image_url}
     except Exception as e:
         db.rollback()
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Failed to upload image: {str(e)}")
 
 @app.get("/api/user/profile")
-async def get_user_profile(current_user: models.User = Depends(get_current_user)):
+async def get_user_profile(current_user: Principal = Depends(get_current_user)):
     """Get user profile information"""
     try:
         return {
@@ -1635,43 +1909,23 @@ async def get_user_profile(current_user: models.User = Depends(get_current_user)
 async def like_post(
     class_id: int,
     post_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Like or unlike a post"""
     # Find the post
-    post = db.query(models.Blog).filter(
-        models.Blog.id == post_id,
-        models.Blog.class_id == class_id
-    ).first()
+    post = await db.scalar(
+        select(models.Blog).where(
+            models.Blog.id == post_id,
+            models.Blog.class_id == class_id
+        )
+    )
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
-    # Check if the user already liked this post
-    existing_like = db.query(models.PostLike).filter(
-        models.PostLike.post_id == post_id,
-        models.PostLike.user_id == current_user.id
-    ).first()
-    
-    if existing_like:
-        # Unlike - remove the like
-        db.delete(existing_like)
-        action = "unliked"
-    else:
-        # Like - add a new like
-        new_like = models.PostLike(
-            post_id=post_id,
-            user_id=current_user.id
-        )
-        db.add(new_like)
-        action = "liked"
-    
-    db.commit()
-    
-    # Get updated like count
-    like_count = db.query(models.PostLike).filter(
-        models.PostLike.post_id == post_id
-    ).count()
+    # Like or unlike; conflict-free, so double-clicks can't race into the unique constraint
+    action, like_count = await post_likes.toggle(db, post_id, current_user.id)
+    await event_broker.publish(class_id, {"type": "post.liked", "post_id": post_id, "likes": like_count})
     
     return {
         "action": action,
@@ -1683,43 +1937,46 @@ async def like_post(
 async def get_post_likes(
     class_id: int,
     post_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get likes for a post"""
     # Find the post
-    post = db.query(models.Blog).filter(
-        models.Blog.id == post_id,
-        models.Blog.class_id == class_id
-    ).first()
+    post = await db.scalar(
+        select(models.Blog).where(
+            models.Blog.id == post_id,
+            models.Blog.class_id == class_id
+        )
+    )
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Check if the current user liked this post
-    user_liked = db.query(models.PostLike).filter(
-        models.PostLike.post_id == post_id,
-        models.PostLike.user_id == current_user.id
-    ).first() is not None
-    
-    # Get all likes
-    likes = db.query(models.PostLike).filter(
-        models.PostLike.post_id == post_id
-    ).all()
+    user_liked = await db.scalar(
+        select(models.PostLike.id).where(
+            models.PostLike.post_id == post_id,
+            models.PostLike.user_id == current_user.id
+        )
+    ) is not None
     
     # Get users who liked
-    like_users = []
-    for like in likes:
-        user = db.query(models.User).filter(models.User.id == like.user_id).first()
-        if user:
-            like_users.append({
-                "id": user.id,
-                "name": f"{user.first_name} {user.last_name}".strip(),
-                "username": user.username
-            })
+    users = await db.scalars(
+        select(models.User).join(
+            models.PostLike, models.PostLike.user_id == models.User.id
+        ).where(models.PostLike.post_id == post_id)
+    )
+    like_users = [
+        {
+            "id": user.id,
+            "name": f"{user.first_name} {user.last_name}".strip(),
+            "username": user.username
+        }
+        for user in users
+    ]
     
     return {
         "post_id": post_id,
-        "like_count": len(likes),
+        "like_count": post.like_count,
         "user_liked": user_liked,
         "users": like_users
     }
@@ -1729,152 +1986,107 @@ async def get_comments(
     class_id: int,
     post_id: int,
     skip: int = 0,
-    limit: int = 20,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get comments for a post, with pagination support"""
     # Find the post
-    post = db.query(models.Blog).filter(
-        models.Blog.id == post_id,
-        models.Blog.class_id == class_id
-    ).first()
+    post = await db.scalar(
+        select(models.Blog).where(
+            models.Blog.id == post_id,
+            models.Blog.class_id == class_id
+        )
+    )
     
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Get root comments first (comments without a parent)
-    root_comments = db.query(models.Comment).filter(
+    query = select(models.Comment).where(
         models.Comment.blog_id == post_id,
         models.Comment.parent_id == None
-    ).order_by(models.Comment.created_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(models.Comment.created_at.desc(), models.Comment.id.desc())
     
-    # Function to recursively get comment data with user info and likes
-    def get_comment_data(comment, depth=0, max_depth=3):
-        # Get user info
-        user = db.query(models.User).filter(models.User.id == comment.user_id).first()
-        
-        # Get like count and current user's like status
-        like_count = db.query(models.CommentLike).filter(
-            models.CommentLike.comment_id == comment.id
-        ).count()
-        
-        user_liked = db.query(models.CommentLike).filter(
-            models.CommentLike.comment_id == comment.id,
-            models.CommentLike.user_id == current_user.id
-        ).first() is not None
-        
-        # Get replies, but limit depth to avoid excessive nesting
-        replies_data = []
-        if depth < max_depth:
-            replies = db.query(models.Comment).filter(
-                models.Comment.parent_id == comment.id
-            ).order_by(models.Comment.created_at).all()
-            
-            for reply in replies:
-                replies_data.append(get_comment_data(reply, depth + 1, max_depth))
-        
-        # Return formatted comment data
-        return {
-            "id": comment.id,
-            "content": comment.content,
-            "created_at": comment.created_at,
-            "updated_at": comment.updated_at,
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "profile_image": user.profile_image
-            },
-            "likes": like_count,
-            "user_liked": user_liked,
-            "replies": replies_data,
-            "has_more_replies": len(comment.replies) > len(replies_data) if depth == max_depth else False,
-            "reply_count": len(comment.replies)
-        }
+    # A cursor takes precedence over skip
+    if cursor:
+        try:
+            query = query.where(keyset_before(models.Comment.created_at, models.Comment.id, cursor))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        query = query.offset(skip)
+    # Fetch one extra row to know whether there is another page
+    root_comments = (await db.scalars(query.limit(limit + 1))).all()
+    has_more = len(root_comments) > limit
+    root_comments = root_comments[:limit]
     
-    # Get formatted comment data for all root comments
-    comments_data = [get_comment_data(comment) for comment in root_comments]
+    # Load the whole thread for this page of root comments in bulk
+    comments_data = await load_comment_trees(db, root_comments, current_user.id, max_depth=3)
     
     # Get total count for pagination
-    total_root_comments = db.query(models.Comment).filter(
-        models.Comment.blog_id == post_id,
-        models.Comment.parent_id == None
-    ).count()
+    total_root_comments = await db.scalar(
+        select(func.count(models.Comment.id)).where(
+            models.Comment.blog_id == post_id,
+            models.Comment.parent_id == None
+        )
+    )
     
     return {
         "comments": comments_data,
         "total": total_root_comments,
-        "has_more": total_root_comments > skip + limit
+        "has_more": has_more,
+        "next_cursor": encode_cursor(root_comments[-1].created_at, root_comments[-1].id) if has_more else None
     }
 
 @app.get("/api/comments/{comment_id}/replies")
 async def get_comment_replies(
     comment_id: int,
     skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get replies for a specific comment"""
     # Check if comment exists
-    comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    comment = await db.get(models.Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Get replies with pagination
-    replies = db.query(models.Comment).filter(
+    # Get replies with pagination, a cursor takes precedence over skip
+    query = select(models.Comment).where(
         models.Comment.parent_id == comment_id
-    ).order_by(models.Comment.created_at).offset(skip).limit(limit).all()
+    ).order_by(models.Comment.created_at, models.Comment.id)
     
-    # Function to format reply data (similar to above but without deep recursion)
-    def format_reply(reply):
-        user = db.query(models.User).filter(models.User.id == reply.user_id).first()
-        
-        like_count = db.query(models.CommentLike).filter(
-            models.CommentLike.comment_id == reply.id
-        ).count()
-        
-        user_liked = db.query(models.CommentLike).filter(
-            models.CommentLike.comment_id == reply.id,
-            models.CommentLike.user_id == current_user.id
-        ).first() is not None
-        
-        # Count number of replies to this reply
-        reply_count = db.query(models.Comment).filter(
-            models.Comment.parent_id == reply.id
-        ).count()
-        
-        return {
-            "id": reply.id,
-            "content": reply.content,
-            "created_at": reply.created_at,
-            "updated_at": reply.updated_at,
-            "user": {
-                "id": user.id,
-                "username": user.username,
-                "first_name": user.first_name,
-                "last_name": user.last_name,
-                "profile_image": user.profile_image
-            },
-            "likes": like_count,
-            "user_liked": user_liked,
-            "reply_count": reply_count,
-            "has_replies": reply_count > 0
-        }
+    if cursor:
+        try:
+            query = query.where(keyset_after(models.Comment.created_at, models.Comment.id, cursor))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        query = query.offset(skip)
+    # Fetch one extra row to know whether there is another page
+    replies = (await db.scalars(query.limit(limit + 1))).all()
+    has_more = len(replies) > limit
+    replies = replies[:limit]
     
-    replies_data = [format_reply(reply) for reply in replies]
+    # Replies are returned flat; clients fetch deeper levels through this endpoint
+    replies_data = await load_comment_trees(db, replies, current_user.id, max_depth=0)
     
     # Get total for pagination
-    total_replies = db.query(models.Comment).filter(
-        models.Comment.parent_id == comment_id
-    ).count()
+    total_replies = await db.scalar(
+        select(func.count(models.Comment.id)).where(
+            models.Comment.parent_id == comment_id
+        )
+    )
     
     return {
         "replies": replies_data,
         "total": total_replies,
-        "has_more": total_replies > skip + limit
+        "has_more": has_more,
+        "next_cursor": encode_cursor(replies[-1].created_at, replies[-1].id) if has_more else None
     }
 
 @app.post("/api/classes/{class_id}/posts/{post_id}/comments")
@@ -1882,15 +2094,17 @@ async def create_comment(
     class_id: int,
     post_id: int,
     comment_data: dict,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Create a new comment on a post or reply to another comment"""
     # Find the post
-    post = db.query(models.Blog).filter(
-        models.Blog.id == post_id,
-        models.Blog.class_id == class_id
-    ).first()
+    post = await db.scalar(
+        select(models.Blog).where(
+            models.Blog.id == post_id,
+            models.Blog.class_id == class_id
+        )
+    )
     
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -1899,10 +2113,12 @@ async def create_comment(
     parent_id = comment_data.get("parent_id")
     if parent_id:
         # Verify parent comment exists
-        parent_comment = db.query(models.Comment).filter(
-            models.Comment.id == parent_id,
-            models.Comment.blog_id == post_id
-        ).first()
+        parent_comment = await db.scalar(
+            select(models.Comment).where(
+                models.Comment.id == parent_id,
+                models.Comment.blog_id == post_id
+            )
+        )
         
         if not parent_comment:
             raise HTTPException(status_code=404, detail="Parent comment not found")
@@ -1916,11 +2132,23 @@ async def create_comment(
     )
     
     db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
+    await db.execute(post_counts_update(post_id, comments=1))
+    await db.execute(post_class_version_update(post_id))
+    await db.execute(document_append_comment(post_id, new_comment.content or ""))
+    if parent_id:
+        await db.execute(comment_counts_update(parent_id, replies=1))
+    await db.commit()
+    await db.refresh(new_comment)
+    local_index.add_comment(post_id, new_comment.content or "")
+    await event_broker.publish(class_id, {
+        "type": "comment.created",
+        "post_id": post_id,
+        "comment_id": new_comment.id,
+        "parent_id": parent_id
+    })
     
     # Return the created comment with user info
-    user = db.query(models.User).filter(models.User.id == current_user.id).first()
+    user = current_user
     
     return {
         "id": new_comment.id,
@@ -1943,40 +2171,27 @@ async def create_comment(
 @app.post("/api/comments/{comment_id}/like")
 async def like_comment(
     comment_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """Like or unlike a comment"""
     # Find the comment
-    comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    comment = await db.get(models.Comment, comment_id)
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Check if the user already liked this comment
-    existing_like = db.query(models.CommentLike).filter(
-        models.CommentLike.comment_id == comment_id,
-        models.CommentLike.user_id == current_user.id
-    ).first()
-    
-    if existing_like:
-        # Unlike - remove the like
-        db.delete(existing_like)
-        action = "unliked"
-    else:
-        # Like - add a new like
-        new_like = models.CommentLike(
-            comment_id=comment_id,
-            user_id=current_user.id
-        )
-        db.add(new_like)
-        action = "liked"
-    
-    db.commit()
-    
-    # Get updated like count
-    like_count = db.query(models.CommentLike).filter(
-        models.CommentLike.comment_id == comment_id
-    ).count()
+    # Like or unlike; conflict-free, so double-clicks can't race into the unique constraint
+    action, like_count = await comment_likes.toggle(db, comment_id, current_user.id)
+    
+    # Notify the comment's class
+    class_id = await db.scalar(select(models.Blog.class_id).where(models.Blog.id == comment.blog_id))
+    if class_id is not None:
+        await event_broker.publish(class_id, {
+            "type": "comment.liked",
+            "post_id": comment.blog_id,
+            "comment_id": comment_id,
+            "likes": like_count
+        })
     
     return {
         "action": action,
@@ -1987,15 +2202,18 @@ async def like_comment(
 @app.get("/api/classes/{class_id}/students")
 async def get_class_students(
     class_id: int,
+    page: PageParams = Depends(page_params),
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Get all students enrolled in a class"""
     # Check if user has access to this class
     if current_user.role == models.UserRole.TEACHER:
         # Teachers can access classes they created
-        class_details = db.query(models.Class).filter(models.Class.id == class_id).first()
-        if not class_details or class_details.teacher_id != current_user.id:
+        if not db.scalar(select(models.Class.id).where(
+            models.Class.id == class_id,
+            models.Class.teacher_id.in_(teacher_record_ids(current_user))
+        )):
             raise HTTPException(status_code=403, detail="Not authorized to access this class")
     elif current_user.role == models.UserRole.STUDENT:
         # Students can access classes they're enrolled in
@@ -2008,43 +2226,91 @@ async def get_class_students(
     else:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Get all enrollments for this class
-    enrollments = db.query(models.ClassEnrollment).filter(
+    # Posts by each student in this class, only evaluated for the returned rows
+    post_count = select(func.count(models.Blog.id)).where(
+        models.Blog.owner_id == models.User.id,
+        models.Blog.class_id == class_id
+    ).correlate(models.User).scalar_subquery()
+    
+    # Enrolled students with their post counts in one query
+    query = db.query(
+        models.User.id,
+        models.User.username,
+        models.User.email,
+        models.User.first_name,
+        models.User.last_name,
+        post_count.label("posts_count")
+    ).join(
+        models.ClassEnrollment, models.ClassEnrollment.student_id == models.User.id
+    ).filter(
         models.ClassEnrollment.class_id == class_id
-    ).all()
-    
-    # Get student details for each enrollment
-    students = []
-    for enrollment in enrollments:
-        student = db.query(models.User).filter(models.User.id == enrollment.student_id).first()
-        if student:
-            # Count posts by this student in this class
-            post_count = db.query(models.Blog).filter(
-                models.Blog.owner_id == student.id,
-                models.Blog.class_id == class_id
-            ).count()
-            
-            students.append({
-                "id": student.id,
-                "username": student.username,
-                "email": student.email,
-                "first_name": student.first_name,
-                "last_name": student.last_name,
-                "posts_count": post_count,
-            })
+    )
+    students = paginate(query, [models.ClassEnrollment.student_id], page).all()
+    
+    return build_page(
+        students,
+        page,
+        key=lambda student: (student.id,),
+        format_item=lambda student: student._asdict()
+    )
+
+@app.post("/api/classes/{class_id}/roster")
+async def import_class_roster(
+    class_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    """Enroll a CSV or JSON roster of students, creating accounts that don't exist yet"""
+    if current_user.role != models.UserRole.TEACHER:
+        raise HTTPException(status_code=403, detail="Not a teacher")
+    
+    owned = await db.scalar(select(models.Class.id).where(
+        models.Class.id == class_id,
+        models.Class.teacher_id.in_(teacher_record_ids(current_user))
+    ))
+    if owned is None:
+        raise HTTPException(status_code=403, detail="Not authorized to access this class")
+    
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        # A roster file uploaded from a form
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing roster file")
+        body = await upload.read()
+        content_type = upload.content_type or ""
+        if (upload.filename or "").lower().endswith(".json"):
+            content_type = "application/json"
+    else:
+        body = await request.body()
     
-    return students
+    report = await import_roster(db, class_id, parse_roster(content_type, body))
+    dashboard_cache.invalidate_class(class_id)
+    return report
 
 # Add this after creating the app
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", UploadFiles(directory="uploads"), name="uploads")
 
 @app.delete("/api/upload/{file_path:path}")
 async def delete_file(
     file_path: str,
-    current_user: models.User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete an uploaded file"""
     try:
+        # Blobs are shared: drop the user's reference, the blob goes with the last one
+        if file_path.startswith(f"{BLOB_DIR.name}/"):
+            sha256 = Path(file_path).name.split(".")[0]
+            if not await release_blob(db, current_user.id, sha256):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="File not found"
+                )
+            return {"message": "File deleted successfully"}
+        
         # Ensure the file belongs to the current user
         user_dir = f"{current_user.id}"
         if not file_path.startswith(user_dir):
@@ -2076,11 +2342,33 @@ async def delete_file(
             detail=f"Failed to delete file: {str(e)}"
         )
 
+@app.get("/api/images/{file_path:path}")
+async def get_image_derivative(
+    file_path: str,
+    request: Request,
+    w: int = Query(..., ge=1, le=4096)
+):
+    """Serve an uploaded image bounded to width w, re-encoded without EXIF"""
+    source = source_path(file_path)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Blob contents never change, so neither do their derivatives
+    cache_control = BLOB_CACHE_CONTROL if file_path.startswith(f"{BLOB_DIR.name}/") else UPLOAD_CACHE_CONTROL
+    try:
+        derivative = await derivative_cache.get(source, derivative_width(w))
+    except RENDER_ERRORS:
+        # Animated or unreadable images are served as uploaded
+        derivative = source
+    
+    return media_response(request.headers, derivative, headers={"Cache-Control": cache_control})
+
 @app.get("/api/download")
 async def download_file(
     url: str,
     filename: str,
-    current_user: models.User = Depends(get_current_user)
+    request: Request,
+    current_user: Principal = Depends(get_current_user)
 ):
     """Force download a file with the specified filename"""
     try:
@@ -2116,12 +2404,18 @@ async def download_file(
                 detail=f"File not found: {full_path}"
             )
         
-        # Return the file as an attachment to force download
-        return FileResponse(
-            path=full_path,
+        # Return the file as an attachment to force download; downloads are
+        # per user, so only the browser may cache them and must revalidate
+        return media_response(
+            request.headers,
+            full_path,
+            method=request.method,
             filename=filename,
             media_type='application/octet-stream',
-            headers={"Content-Disposition": f"attachment; filename=\"{filename}\""}
+            headers={
+                "Content-Disposition": f"attachment; filename=\"{filename}\"",
+                "Cache-Control": "private, no-cache"
+            }
         )
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -2132,5 +2426,7 @@ async def download_file(
             detail=f"Failed to download file: {str(e)}"
         )
 
+boot_timer.mark("imported")
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,104 @@
+# media.py
+import hashlib
+import os
+from email.utils import parsedate
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+
+# Bigger reads mean fewer thread hops per streamed video
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+# Headers a 304 keeps from the response it replaces
+NOT_MODIFIED_HEADERS = ("cache-control", "content-location", "date", "etag", "expires", "last-modified", "vary")
+
+
+class MediaFileResponse(FileResponse):
+    """FileResponse that hands the file to the server with sendfile when it can.
+
+    Range requests (206/416, If-Range) are handled by FileResponse; servers
+    that offer the ASGI zero-copy send extension get the file descriptor
+    instead of the bytes.
+
+    _handle_simple and _handle_single_range override private FileResponse
+    methods as of Starlette 0.45.3 (pinned in requirements.txt); recheck
+    them, and tests/test_media.py, when upgrading Starlette.
+    """
+    chunk_size = MEDIA_CHUNK_SIZE
+
+    async def __call__(self, scope, receive, send):
+        self._zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+
+        async def send_with_unit(message):
+            # Starlette's 416 says "Content-Range: */size"; RFC 9110 wants "bytes */size"
+            if message["type"] == "http.response.start" and message["status"] == 416:
+                message["headers"] = [
+                    (name, b"bytes " + value if name == b"content-range" and value.startswith(b"*/") else value)
+                    for name, value in message["headers"]
+                ]
+            await send(message)
+
+        await super().__call__(scope, receive, send_with_unit)
+
+    async def _sendfile(self, send, offset: int, count: int):
+        with open(self.path, "rb") as file:
+            await send({
+                "type": ZEROCOPY_EXTENSION,
+                "file": file,
+                "offset": offset,
+                "count": count,
+                "more_body": False
+            })
+
+    async def _handle_simple(self, send, send_header_only: bool):
+        if not self._zerocopy or send_header_only:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await self._sendfile(send, 0, int(self.headers["content-length"]))
+
+    async def _handle_single_range(self, send, start: int, end: int, file_size: int, send_header_only: bool):
+        if not self._zerocopy or send_header_only:
+            return await super()._handle_single_range(send, start, end, file_size, send_header_only)
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        await self._sendfile(send, start, end - start)
+
+
+def is_not_modified(request_headers: Headers, response_headers) -> bool:
+    """True if the request's If-None-Match / If-Modified-Since validators still match"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence; weak comparison as in RFC 9110
+        etag = response_headers.get("etag", "").removeprefix("W/")
+        return if_none_match.strip() == "*" or etag in (
+            tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = parsedate(request_headers.get("if-modified-since", ""))
+    last_modified = parsedate(response_headers.get("last-modified", ""))
+    return if_modified_since is not None and last_modified is not None and if_modified_since >= last_modified
+
+
+def weak_etag(*parts) -> str:
+    """Weak ETag for a response derived from parts (e.g. a version and the query)"""
+    digest = hashlib.sha1(":".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def not_modified_response(response_headers) -> Response:
+    return Response(
+        status_code=304,
+        headers={name: value for name, value in response_headers.items() if name.lower() in NOT_MODIFIED_HEADERS}
+    )
+
+
+def media_response(request_headers: Headers, path: Path, method: str = "GET", **kwargs) -> Response:
+    """Serve a file with Range support, ETag/Last-Modified validators and 304 handling"""
+    response = MediaFileResponse(path, stat_result=os.stat(path), **kwargs)
+    if method in ("GET", "HEAD") and is_not_modified(request_headers, response.headers):
+        return not_modified_response(response.headers)
+    return response
@@ -0,0 +1,185 @@
+# migrations.py
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, delete, func, inspect, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+import models
+from base import Base
+from counters import reconcile_counters
+from rich_content import backfill_summaries
+from search import rebuild_documents
+
+# Held while migrating so workers booting together apply each step once
+MIGRATION_LOCK_ID = 7231904
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False, default=datetime.utcnow)
+)
+
+
+def _create_tables(db: Session):
+    # Missing tables come from the current models, so on a new database this
+    # already builds everything later steps add; those must check first
+    Base.metadata.create_all(db.connection())
+
+
+# Columns added to existing tables before migrations existed; databases built
+# by the old drop-and-recreate startup may predate any of them
+PRE_MIGRATION_COLUMNS = [
+    models.Blog.__table__.c.blocks,
+    models.Blog.__table__.c.excerpt,
+    models.Blog.__table__.c.word_count,
+    models.Blog.__table__.c.reading_time,
+    models.Blog.__table__.c.like_count,
+    models.Blog.__table__.c.comment_count,
+    models.Comment.__table__.c.like_count,
+    models.Comment.__table__.c.reply_count,
+    models.Class.__table__.c.version,
+]
+
+
+def _add_missing_columns(db: Session):
+    connection = db.connection()
+    preparer = connection.dialect.identifier_preparer
+    existing = {}
+    for column in PRE_MIGRATION_COLUMNS:
+        table = column.table.name
+        if table not in existing:
+            existing[table] = {info["name"] for info in inspect(connection).get_columns(table)}
+        if column.name in existing[table]:
+            continue
+        ddl = f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {preparer.quote(column.name)} "
+        ddl += column.type.compile(dialect=connection.dialect)
+        if column.server_default is not None:
+            ddl += f" DEFAULT {column.server_default.arg} NOT NULL"
+        connection.execute(text(ddl))
+
+
+def _create_indexes(*indexes):
+    def step(db: Session):
+        for index in indexes:
+            # IF NOT EXISTS rather than checkfirst: SQLite can't reflect
+            # expression indexes, so checkfirst misses ix_users_email_lower
+            db.execute(CreateIndex(index, if_not_exists=True))
+    return step
+
+
+def _model_index(model, name: str):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+def _unique_enrollments(db: Session):
+    connection = db.connection()
+    table = models.ClassEnrollment.__table__
+    constraint = next(c for c in table.constraints if c.name == "unique_class_enrollment")
+    inspector = inspect(connection)
+    existing = {c["name"] for c in inspector.get_unique_constraints(table.name)}
+    existing.update(index["name"] for index in inspector.get_indexes(table.name))
+    if constraint.name in existing:
+        return
+    # Keep each student's first enrollment in a class
+    first = select(func.min(table.c.id)).group_by(table.c.student_id, table.c.class_id)
+    connection.execute(delete(table).where(table.c.id.not_in(first)))
+    if connection.dialect.name == "sqlite":
+        # SQLite can't add a constraint to an existing table; a unique index
+        # under the same name enforces it and serves ON CONFLICT the same way
+        connection.execute(text(
+            f"CREATE UNIQUE INDEX {constraint.name} ON {table.name} (student_id, class_id)"
+        ))
+    else:
+        connection.execute(AddConstraint(constraint))
+
+
+def _drop_index(name: str):
+    def step(db: Session):
+        db.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    return step
+
+
+# (version, name, step), applied in order; never edit or reorder a released step
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "add columns from before migrations", _add_missing_columns),
+    # ix_class_enrollments_student_id_class_id was created here until step 8
+    # replaced it with the unique constraint's index
+    (3, "hot path indexes", _create_indexes(
+        _model_index(models.ClassEnrollment, "ix_class_enrollments_class_id_student_id"),
+        _model_index(models.Blog, "ix_blogs_class_id_created_at"),
+        _model_index(models.Blog, "ix_blogs_owner_id_created_at"),
+        _model_index(models.Blog, "ix_blogs_created_at_id"),
+        _model_index(models.Comment, "ix_comments_blog_id_parent_id_created_at"),
+        _model_index(models.Comment, "ix_comments_parent_id")
+    )),
+    # Counter columns added by step 2 start at zero
+    (4, "reconcile counters", reconcile_counters),
+    (5, "backfill post summaries", backfill_summaries),
+    (6, "rebuild search documents", rebuild_documents),
+    (7, "unique class enrollments", _unique_enrollments),
+    (8, "drop enrollment index duplicated by the unique constraint", _drop_index("ix_class_enrollments_student_id_class_id")),
+    (9, "case-insensitive email index", _create_indexes(_model_index(models.User, "ix_users_email_lower"))),
+]
+
+
+def applied_versions(engine: Engine) -> set:
+    with engine.connect() as connection:
+        if not engine.dialect.has_table(connection, schema_migrations.name):
+            return set()
+        return set(connection.scalars(select(schema_migrations.c.version)))
+
+
+def migrate(engine: Engine) -> list:
+    """Apply pending migrations in order; returns the names of those applied.
+
+    Safe to run on every boot: applied versions are recorded in
+    schema_migrations and skipped. A step's version row is committed once
+    the step returns. Schema steps run in that same transaction; the data
+    steps commit in batches as they go, so each is written to be safe to
+    rerun if it fails part way.
+    """
+    applied = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        if engine.dialect.name == "postgresql":
+            lock.execute(text("SELECT pg_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+        try:
+            schema_migrations.create(engine, checkfirst=True)
+            done = applied_versions(engine)
+            for version, name, step in MIGRATIONS:
+                if version in done:
+                    continue
+                with Session(engine) as db:
+                    step(db)
+                    db.execute(insert(schema_migrations).values(version=version, name=name))
+                    db.commit()
+                applied.append(name)
+        finally:
+            if engine.dialect.name == "postgresql":
+                lock.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+    return applied
+
+
+def migration_status(engine: Engine) -> dict:
+    done = applied_versions(engine)
+    return {
+        "version": max(done, default=0),
+        "latest": MIGRATIONS[-1][0],
+        "pending": [name for version, name, _ in MIGRATIONS if version not in done]
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import engine
+
+    if "--status" in sys.argv:
+        print(migration_status(engine))
+    else:
+        applied = migrate(engine)
+        print(f"Applied {len(applied)} migrations" + (f": {', '.join(applied)}" if applied else ""))
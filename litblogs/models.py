@@ -1,6 +1,6 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func, Enum as SQLAlchemyEnum, Boolean, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, func, Enum as SQLAlchemyEnum, Boolean, UniqueConstraint, JSON, Index, literal_column
+from sqlalchemy.orm import relationship, deferred
 from base import Base
 from enum import Enum
 from datetime import datetime
@@ -31,6 +31,11 @@ class User(Base):
     comments = relationship("Comment", back_populates="user", cascade="all, delete-orphan")
     comment_likes = relationship("CommentLike", back_populates="user", cascade="all, delete-orphan")
 
+    # Case-insensitive email lookups (roster import, bulk provisioning)
+    __table_args__ = (
+        Index('ix_users_email_lower', func.lower(email)),
+    )
+
 class Teacher(Base):
     __tablename__ = "teachers"
     id = Column(Integer, primary_key=True, index=True)
@@ -48,6 +53,8 @@ class Class(Base):
     description = Column(Text, nullable=True)
     access_code = Column(String(6), unique=True, nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Bumped by every post, comment and post-like write in the class (see counters.py)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
     teacher_id = Column(Integer, ForeignKey("teachers.id"))
     teacher = relationship("Teacher", back_populates="classes")
     students = relationship("ClassEnrollment", back_populates="class_")
@@ -62,19 +69,43 @@ class ClassEnrollment(Base):
     student = relationship("User", back_populates="enrolled_classes")
     class_ = relationship("Class", back_populates="students")
 
+    # Sort keys of the paginated student-classes and class-students lists;
+    # the unique constraint's index serves the student-classes one
+    __table_args__ = (
+        UniqueConstraint('student_id', 'class_id', name='unique_class_enrollment'),
+        Index('ix_class_enrollments_class_id_student_id', 'class_id', 'student_id'),
+    )
+
 class Blog(Base):
     __tablename__ = "blogs"
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), index=True, nullable=False)
     content = Column(Text, nullable=False)
+    # Typed code/media/poll/file blocks (see rich_content.py); deferred so
+    # list queries never load them
+    blocks = deferred(Column(JSON(none_as_null=True), nullable=True))
+    # Plain-text summary computed at write time for list views
+    excerpt = Column(String(300), nullable=True)
+    word_count = Column(Integer, nullable=False, default=0, server_default="0")
+    reading_time = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     class_id = Column(Integer, ForeignKey("classes.id"), nullable=False)
+    # Denormalized counters, maintained by the write paths (see counters.py)
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
     owner = relationship("User", back_populates="blogs")
     class_ = relationship("Class", back_populates="blogs")
     likes = relationship("PostLike", back_populates="post", cascade="all, delete-orphan")
     comments = relationship("Comment", back_populates="blog")
 
+    # Sort keys of the paginated /api/blogs, student posts and class feed lists
+    __table_args__ = (
+        Index('ix_blogs_created_at_id', 'created_at', 'id'),
+        Index('ix_blogs_owner_id_created_at', 'owner_id', 'created_at'),
+        Index('ix_blogs_class_id_created_at', 'class_id', 'created_at', 'id'),
+    )
+
 class PostLike(Base):
     __tablename__ = "post_likes"
     
@@ -105,6 +136,9 @@ class Comment(Base):
     blog_id = Column(Integer, ForeignKey("blogs.id", ondelete="CASCADE"), nullable=False)
     # Add parent_id for threaded comments
     parent_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), nullable=True)
+    # Denormalized counters, maintained by the write paths (see counters.py)
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Relationships
     user = relationship("User", back_populates="comments")
@@ -114,6 +148,12 @@ class Comment(Base):
     parent = relationship("Comment", back_populates="replies", remote_side=[id])
     # Add likes relationship
     likes = relationship("CommentLike", back_populates="comment", cascade="all, delete-orphan")
+    
+    # A post's top-level comments in order, and the replies below a comment
+    __table_args__ = (
+        Index('ix_comments_blog_id_parent_id_created_at', 'blog_id', 'parent_id', 'created_at'),
+        Index('ix_comments_parent_id', 'parent_id'),
+    )
 
 class CommentLike(Base):
     __tablename__ = "comment_likes"
@@ -130,4 +170,59 @@ class CommentLike(Base):
     # Add a unique constraint to ensure a user can only like a comment once
     __table_args__ = (
         UniqueConstraint('comment_id', 'user_id', name='unique_comment_like'),
-    )
\ No newline at end of file
+    )
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    
+    # Uploaded content is stored once, keyed by its SHA-256
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String(255), nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    references = relationship("UserUpload", back_populates="blob")
+
+class UserUpload(Base):
+    __tablename__ = "user_uploads"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    kind = Column(String(20), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    blob = relationship("Blob", back_populates="references")
+    
+    # A user references each blob once, however often they upload it
+    __table_args__ = (
+        UniqueConstraint('user_id', 'sha256', name='unique_user_upload'),
+    )
+
+def search_vector(title, content, comments):
+    """Weighted Postgres tsvector of a search document; literals only, so the GIN index matches"""
+    def vector(text, weight):
+        english = literal_column("'english'")
+        return func.setweight(func.to_tsvector(english, func.coalesce(text, literal_column("''"))), literal_column(f"'{weight}'"))
+    return vector(title, "A").op("||")(vector(content, "B")).op("||")(vector(comments, "C"))
+
+class SearchDocument(Base):
+    __tablename__ = "search_documents"
+    
+    # Plain text of a class post and its comments, maintained by the write paths (see search.py)
+    post_id = Column(Integer, ForeignKey("blogs.id", ondelete="CASCADE"), primary_key=True)
+    class_id = Column(Integer, ForeignKey("classes.id", ondelete="CASCADE"), nullable=False, index=True)
+    title = Column(String(255), nullable=False)
+    content = Column(Text, nullable=False, default="")
+    comments = Column(Text, nullable=False, default="", server_default="")
+    
+    __table_args__ = (
+        Index(
+            'ix_search_documents_vector',
+            search_vector(title, content, comments),
+            postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+    )
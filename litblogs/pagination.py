@@ -0,0 +1,118 @@
+# pagination.py
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(*values) -> str:
+    """Encode a keyset position (the sort key of the last row) as an opaque cursor string"""
+    payload = json.dumps([_encode_value(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int = 2) -> tuple:
+    """Decode a cursor produced by encode_cursor back into its size key values"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("wrong number of key values")
+        return tuple(_decode_value(value) for value in values)
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def keyset(columns, values, descending: bool = False):
+    """Filter clause for rows strictly past values in the (columns) sort order"""
+    clauses = []
+    for index, (column, value) in enumerate(zip(columns, values)):
+        past = column < value if descending else column > value
+        ties = [earlier == earlier_value for earlier, earlier_value in zip(columns[:index], values[:index])]
+        clauses.append(and_(*ties, past))
+    return or_(*clauses)
+
+
+def keyset_before(created_at_column, id_column, cursor: str):
+    """Filter clause for rows strictly after the cursor in (created_at DESC, id DESC) order"""
+    return keyset([created_at_column, id_column], decode_cursor(cursor), descending=True)
+
+
+def keyset_after(created_at_column, id_column, cursor: str):
+    """Filter clause for rows strictly after the cursor in (created_at ASC, id ASC) order"""
+    return keyset([created_at_column, id_column], decode_cursor(cursor))
+
+
+@dataclass
+class PageParams:
+    cursor: Optional[str] = None
+    limit: Optional[int] = None
+
+    @property
+    def requested(self) -> bool:
+        # Without cursor or limit, list endpoints keep returning a plain list
+        return self.cursor is not None or self.limit is not None
+
+    @property
+    def size(self) -> int:
+        return self.limit or DEFAULT_PAGE_SIZE
+
+
+def page_params(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE)
+) -> PageParams:
+    """Query parameters shared by the cursor-paginated list endpoints"""
+    return PageParams(cursor=cursor, limit=limit)
+
+
+def paginate(query, sort_columns, params: PageParams, descending: bool = False):
+    """Order a Query/Select by sort_columns and restrict it to the requested page.
+
+    One extra row is fetched so build_page can tell whether a next page exists.
+    """
+    query = query.order_by(*(column.desc() if descending else column for column in sort_columns))
+    if not params.requested:
+        return query
+    if params.cursor:
+        try:
+            values = decode_cursor(params.cursor, len(sort_columns))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(keyset(sort_columns, values, descending))
+    return query.limit(params.size + 1)
+
+
+def build_page(rows, params: PageParams, key, format_item):
+    """Format a page of rows; key(row) returns the row's sort key values"""
+    if not params.requested:
+        return [format_item(row) for row in rows]
+    has_more = len(rows) > params.size
+    rows = rows[:params.size]
+    return {
+        "items": [format_item(row) for row in rows],
+        "next_cursor": encode_cursor(*key(rows[-1])) if has_more else None
+    }
@@ -0,0 +1,155 @@
+# passwords.py
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# Changing the rounds (or scheme) makes existing hashes "need update", so they
+# are transparently re-hashed the next time their owner logs in
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+# bcrypt releases the GIL, so threads are enough; "process" is available for
+# hosts where other CPU work shares the interpreter
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_POOL = os.getenv("PASSWORD_HASH_POOL", "thread")
+# Bulk provisioning hashes in its own process pool, leaving the pool above to logins
+BULK_HASH_WORKERS = int(os.getenv("BULK_HASH_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _hash_many(passwords: list) -> list:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+def _verify_and_update(password: str, hashed: str):
+    return pwd_context.verify_and_update(password, hashed)
+
+
+class HashMetrics:
+    """Queue time and hashing time for the password pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.operations = 0
+        self.in_flight = 0
+        self.rehashes = 0
+        self.queue_total = 0.0
+        self.queue_max = 0.0
+        self.work_total = 0.0
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, queued: float, worked: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.operations += 1
+            self.queue_total += queued
+            self.queue_max = max(self.queue_max, queued)
+            self.work_total += worked
+
+    def record_rehash(self):
+        with self._lock:
+            self.rehashes += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            ops = self.operations or 1
+            return {
+                "pool": HASH_POOL,
+                "workers": HASH_WORKERS,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "operations": self.operations,
+                "in_flight": self.in_flight,
+                "rehashes": self.rehashes,
+                "queue_avg_ms": round(self.queue_total / ops * 1000, 3),
+                "queue_max_ms": round(self.queue_max * 1000, 3),
+                "hash_avg_ms": round(self.work_total / ops * 1000, 3)
+            }
+
+
+hash_metrics = HashMetrics()
+_executor = None
+_bulk_executor = None
+_semaphore = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        pool_class = ProcessPoolExecutor if HASH_POOL == "process" else ThreadPoolExecutor
+        _executor = pool_class(max_workers=HASH_WORKERS)
+    return _executor
+
+
+def get_bulk_executor():
+    global _bulk_executor
+    if _bulk_executor is None:
+        _bulk_executor = ProcessPoolExecutor(max_workers=BULK_HASH_WORKERS)
+    return _bulk_executor
+
+
+def _get_semaphore():
+    # Caps in-flight hashes per worker so a login burst queues here
+    # instead of piling work onto the executor
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(HASH_WORKERS)
+    return _semaphore
+
+
+async def _run(func, *args):
+    queued_at = time.perf_counter()
+    async with _get_semaphore():
+        started_at = time.perf_counter()
+        hash_metrics.start()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(get_executor(), func, *args)
+        finally:
+            hash_metrics.finish(started_at - queued_at, time.perf_counter() - started_at)
+
+
+async def hash_password(password: str) -> str:
+    """Hash a password off the event loop"""
+    return await _run(_hash, password)
+
+
+async def hash_passwords(passwords: list) -> list:
+    """Hash many passwords across the bulk process pool, in order"""
+    if not passwords:
+        return []
+    # A few chunks per worker keeps them all busy without pickling per password
+    size = max(1, -(-len(passwords) // (BULK_HASH_WORKERS * 4)))
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(get_bulk_executor(), _hash_many, passwords[i:i + size])
+        for i in range(0, len(passwords), size)
+    ))
+    return [hashed for chunk in chunks for hashed in chunk]
+
+
+async def verify_password(plain_password: str, hashed_password: str):
+    """Verify a password off the event loop.
+
+    Returns (valid, new_hash); new_hash is set when the stored hash uses an
+    outdated scheme or cost and should replace it.
+    """
+    valid, new_hash = await _run(_verify_and_update, plain_password, hashed_password)
+    if new_hash:
+        hash_metrics.record_rehash()
+    return valid, new_hash
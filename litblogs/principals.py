@@ -0,0 +1,91 @@
+# principals.py
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from cachetools import TTLCache
+
+import models
+
+# Cached principals may be up to this many seconds stale in other workers
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Read-only snapshot of the authenticated user"""
+    id: int
+    username: str
+    email: str
+    first_name: Optional[str]
+    last_name: Optional[str]
+    role: models.UserRole
+    is_admin: bool
+    created_at: Optional[datetime]
+    bio: Optional[str]
+    profile_image: Optional[str]
+    cover_image: Optional[str]
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            role=user.role,
+            is_admin=bool(user.is_admin),
+            created_at=user.created_at,
+            bio=user.bio,
+            profile_image=user.profile_image,
+            cover_image=user.cover_image
+        )
+
+
+class PrincipalCache:
+    """TTL + LRU cache of principals keyed by user id"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            principal = self._cache.get(user_id)
+            if principal is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return principal
+
+    def put(self, principal: Principal):
+        with self._lock:
+            self._cache[principal.id] = principal
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.invalidations += 1
+            self._cache.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
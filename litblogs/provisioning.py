@@ -0,0 +1,190 @@
+# provisioning.py
+import os
+import secrets
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from passwords import hash_passwords
+from roster import EMAIL_PATTERN
+
+PROVISION_MAX_USERS = int(os.getenv("PROVISION_MAX_USERS", "5000"))
+# Rows per INSERT statement
+PROVISION_BATCH_SIZE = int(os.getenv("PROVISION_BATCH_SIZE", "500"))
+ROLES = ("STUDENT", "TEACHER", "ADMIN")
+
+
+def _check_rows(users: list, results: list) -> list:
+    """Indexes of rows that are valid and unique within the batch; the rest get an error result"""
+    valid = []
+    emails = {}
+    usernames = {}
+    for index, (user, result) in enumerate(zip(users, results)):
+        email = user["email"].lower()
+        if user["role"] not in ROLES:
+            result.update(status="error", detail="Invalid role")
+        elif not EMAIL_PATTERN.match(email):
+            result.update(status="error", detail="Missing or invalid email")
+        elif not user["username"] or len(user["username"]) > 50:
+            result.update(status="error", detail="Username must be 1 to 50 characters")
+        elif email in emails:
+            result.update(status="error", detail=f"Duplicate email of row {emails[email] + 1}")
+        elif user["username"] in usernames:
+            result.update(status="error", detail=f"Duplicate username of row {usernames[user['username']] + 1}")
+        else:
+            emails[email] = index
+            usernames[user["username"]] = index
+            valid.append(index)
+    return valid
+
+
+async def provision_users(db: AsyncSession, users: list) -> dict:
+    """Create accounts for a batch of users (dicts shaped like schemas.UserProvision).
+
+    Uniqueness is checked for the whole batch in one query, passwords are
+    hashed across the bulk process pool, and users (plus Teacher records
+    for teachers) are inserted PROVISION_BATCH_SIZE rows per statement.
+    Users without a password get a generated one, returned in their result.
+    """
+    if len(users) > PROVISION_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"Batches are limited to {PROVISION_MAX_USERS} users")
+    started_at = time.perf_counter()
+    users = [
+        {**user, "email": user["email"].strip(), "username": user["username"].strip(), "role": user["role"].upper()}
+        for user in users
+    ]
+    results = [{"row": index + 1, "email": user["email"], "username": user["username"]} for index, user in enumerate(users)]
+    valid = _check_rows(users, results)
+
+    if valid:
+        emails = [users[i]["email"].lower() for i in valid]
+        usernames = [users[i]["username"] for i in valid]
+        taken = (await db.execute(
+            select(func.lower(models.User.email), models.User.username).where(
+                or_(func.lower(models.User.email).in_(emails), models.User.username.in_(usernames))
+            )
+        )).all()
+        taken_emails = {email for email, _ in taken}
+        taken_usernames = {username for _, username in taken}
+        teacher_emails = [users[i]["email"].lower() for i in valid if users[i]["role"] == "TEACHER"]
+        if teacher_emails:
+            # Teacher records predating their user account
+            taken_emails.update((await db.scalars(
+                select(func.lower(models.Teacher.email)).where(func.lower(models.Teacher.email).in_(teacher_emails))
+            )).all())
+        for i in valid:
+            if users[i]["email"].lower() in taken_emails:
+                results[i].update(status="error", detail="Email already registered")
+            elif users[i]["username"] in taken_usernames:
+                results[i].update(status="error", detail="Username already registered")
+        valid = [i for i in valid if "status" not in results[i]]
+
+    for i in valid:
+        if not users[i].get("password"):
+            users[i]["password"] = results[i]["initial_password"] = secrets.token_urlsafe(12)
+    hash_started_at = time.perf_counter()
+    hashes = await hash_passwords([users[i]["password"] for i in valid])
+    hash_seconds = time.perf_counter() - hash_started_at
+
+    try:
+        for start in range(0, len(valid), PROVISION_BATCH_SIZE):
+            batch = valid[start:start + PROVISION_BATCH_SIZE]
+            created = await db.execute(
+                insert(models.User).returning(models.User.id, models.User.username),
+                [
+                    {
+                        "username": users[i]["username"],
+                        "email": users[i]["email"],
+                        "password": hashed,
+                        "first_name": users[i].get("first_name"),
+                        "last_name": users[i].get("last_name"),
+                        "role": models.UserRole[users[i]["role"]],
+                        "is_admin": users[i]["role"] == "ADMIN"
+                    }
+                    for i, hashed in zip(batch, hashes[start:start + PROVISION_BATCH_SIZE])
+                ]
+            )
+            user_ids = {username: user_id for user_id, username in created.all()}
+            teachers = [
+                {
+                    "name": " ".join(filter(None, (users[i].get("first_name"), users[i].get("last_name")))),
+                    "email": users[i]["email"],
+                    "hashed_password": hashed,
+                    "user_id": user_ids[users[i]["username"]]
+                }
+                for i, hashed in zip(batch, hashes[start:start + PROVISION_BATCH_SIZE])
+                if users[i]["role"] == "TEACHER"
+            ]
+            if teachers:
+                await db.execute(insert(models.Teacher), teachers)
+            for i in batch:
+                results[i].update(status="created", user_id=user_ids[users[i]["username"]])
+        await db.commit()
+    except IntegrityError:
+        # Someone registered one of these emails or usernames after the check
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Some users were registered concurrently; retry the batch")
+
+    seconds = time.perf_counter() - started_at
+    return {
+        "created": len(valid),
+        "errors": len(users) - len(valid),
+        "seconds": round(seconds, 3),
+        "hash_seconds": round(hash_seconds, 3),
+        "users_per_second": round(len(valid) / seconds, 1) if seconds else None,
+        "results": results
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import csv
+    import sys
+
+    from database import AsyncSessionLocal
+
+    parser = argparse.ArgumentParser(description="Create accounts from a CSV of username,email,password,first_name,last_name,role")
+    parser.add_argument("csv_file")
+    parser.add_argument("--role", default="STUDENT", help="role for rows without one")
+    parser.add_argument("--output", help="write per-row results (with generated passwords) to this CSV")
+    args = parser.parse_args()
+
+    with open(args.csv_file, newline="", encoding="utf-8-sig") as f:
+        rows = [
+            {
+                "username": row.get("username") or "",
+                "email": row.get("email") or "",
+                "password": row.get("password") or None,
+                "first_name": row.get("first_name") or None,
+                "last_name": row.get("last_name") or None,
+                "role": row.get("role") or args.role
+            }
+            for row in csv.DictReader(f)
+        ]
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            return await provision_users(db, rows)
+
+    try:
+        report = asyncio.run(run())
+    except HTTPException as e:
+        sys.exit(e.detail)
+    if args.output:
+        fields = ["row", "email", "username", "status", "user_id", "initial_password", "detail"]
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(report["results"])
+    for result in report["results"]:
+        if result["status"] == "error":
+            print(f"row {result['row']}: {result['detail']}")
+    print(
+        f"Created {report['created']} users ({report['errors']} errors) in {report['seconds']} s, "
+        f"{report['users_per_second']} users/s; hashing took {report['hash_seconds']} s"
+    )
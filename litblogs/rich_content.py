@@ -0,0 +1,151 @@
+# rich_content.py
+import math
+import re
+
+from sqlalchemy import or_
+
+import models
+import schemas
+
+# [CODE:lang]code, [GIF:url], [IMAGE:url], [POLL:a,b,c] and [FILE:name|url]
+# markers as they used to be appended to post content
+MARKER_KINDS = ("CODE", "GIF", "IMAGE", "POLL", "FILE")
+MARKER_PATTERN = re.compile(r"\[(?P<kind>CODE|GIF|IMAGE|POLL|FILE):(?P<arg>[^\]\n]*)\]")
+
+EXCERPT_CHARS = 280
+WORDS_PER_MINUTE = 200
+
+
+def blocks_from_post(post: schemas.BlogCreate) -> list:
+    """Typed content blocks from the structured fields of a BlogCreate"""
+    blocks = []
+    for snippet in post.code_snippets or []:
+        blocks.append({"type": "code", "language": snippet["language"], "code": snippet["code"]})
+    for media in post.media or []:
+        if media["type"] in ("gif", "image"):
+            blocks.append({"type": media["type"], "url": media["url"]})
+    for poll in post.polls or []:
+        blocks.append({"type": "poll", "options": list(poll["options"])})
+    for file in post.files or []:
+        blocks.append({"type": "file", "name": file["name"], "url": file["url"]})
+    return blocks
+
+
+def plain_text(content: str) -> str:
+    """Text of post or comment HTML without any markup"""
+    # Loaded on first use to keep bs4 out of worker boot
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(content, "html.parser").get_text(" ", strip=True)
+
+
+def summarize_html(content: str) -> dict:
+    """Plain-text excerpt, word count and reading time (minutes) for post HTML"""
+    words = plain_text(content).split()
+    excerpt = " ".join(words)
+    if len(excerpt) > EXCERPT_CHARS:
+        excerpt = excerpt[:EXCERPT_CHARS].rsplit(" ", 1)[0] + "..."
+    return {
+        "excerpt": excerpt,
+        "word_count": len(words),
+        "reading_time": math.ceil(len(words) / WORDS_PER_MINUTE)
+    }
+
+
+def has_block_fields(post: schemas.BlogCreate) -> bool:
+    return any(
+        field is not None
+        for field in (post.code_snippets, post.media, post.polls, post.files)
+    )
+
+
+def _marker_block(kind: str, arg: str) -> dict:
+    if kind == "POLL":
+        return {"type": "poll", "options": arg.split(",") if arg else []}
+    if kind == "FILE":
+        name, _, url = arg.partition("|")
+        return {"type": "file", "name": name, "url": url}
+    return {"type": kind.lower(), "url": arg}
+
+
+def parse_markers(content: str):
+    """Split legacy marker text out of content in a single pass.
+
+    Returns (content_without_markers, blocks) with blocks in document order.
+    As in the frontend renderer, a CODE marker's code runs up to the next
+    marker or the end of the content.
+    """
+    matches = list(MARKER_PATTERN.finditer(content))
+    if not matches:
+        return content, []
+
+    blocks = []
+    pieces = [content[:matches[0].start()]]
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(content)
+        following = content[match.end():end]
+        if match.group("kind") == "CODE":
+            blocks.append({"type": "code", "language": match.group("arg"), "code": following.strip("\n")})
+        else:
+            blocks.append(_marker_block(match.group("kind"), match.group("arg")))
+            pieces.append(following)
+    return "".join(pieces).rstrip("\n"), blocks
+
+
+def migrate_marker_content(db, batch_size: int = 200) -> int:
+    """Move marker text of existing posts into Blog.blocks; returns posts changed"""
+    migrated = 0
+    last_id = 0
+    while True:
+        posts = db.query(models.Blog).filter(
+            models.Blog.id > last_id,
+            or_(*(models.Blog.content.contains(f"[{kind}:") for kind in MARKER_KINDS))
+        ).order_by(models.Blog.id).limit(batch_size).all()
+        if not posts:
+            break
+        for post in posts:
+            content, blocks = parse_markers(post.content)
+            if blocks:
+                post.content = content
+                post.blocks = (post.blocks or []) + blocks
+                migrated += 1
+        last_id = posts[-1].id
+        db.commit()
+    return migrated
+
+
+def backfill_summaries(db, batch_size: int = 200) -> int:
+    """Compute excerpt, word count and reading time for posts that lack them"""
+    updated = 0
+    last_id = 0
+    while True:
+        posts = db.query(models.Blog).filter(
+            models.Blog.id > last_id,
+            models.Blog.excerpt.is_(None)
+        ).order_by(models.Blog.id).limit(batch_size).all()
+        if not posts:
+            break
+        for post in posts:
+            for field, value in summarize_html(post.content).items():
+                setattr(post, field, value)
+            updated += 1
+        last_id = posts[-1].id
+        db.commit()
+    return updated
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import SessionLocal
+
+    # Moving markers out of content is one-way and the frontend still renders
+    # [CODE:...] markers from content, so it only runs when asked for by name.
+    # Excerpts are backfilled by the migrations (python migrations.py)
+    if sys.argv[1:] != ["--migrate-markers"]:
+        sys.exit("usage: python rich_content.py --migrate-markers")
+    db = SessionLocal()
+    try:
+        print(f"Migrated rich content markers in {migrate_marker_content(db)} posts")
+    finally:
+        db.close()
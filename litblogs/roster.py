@@ -0,0 +1,165 @@
+# roster.py
+import csv
+import io
+import json
+import random
+import re
+import secrets
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from likes import insert_ignoring_conflicts
+from passwords import hash_password
+
+ROSTER_MAX_ROWS = 5000
+# Times to re-match and retry creating accounts that someone else registered meanwhile
+ROSTER_CREATE_ATTEMPTS = 3
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+ROSTER_FIELDS = ("email", "first_name", "last_name", "username")
+
+
+def _normalize(row: dict) -> dict:
+    fields = {str(key).strip().lower().replace(" ", "_"): value for key, value in row.items() if key is not None}
+    return {field: str(fields.get(field) or "").strip() for field in ROSTER_FIELDS}
+
+
+def parse_roster(content_type: str, body: bytes) -> list:
+    """Roster rows from a JSON body (a list, or {"students": [...]}) or CSV with a header row"""
+    try:
+        if "json" in content_type:
+            data = json.loads(body)
+            rows = data.get("students", []) if isinstance(data, dict) else data
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValueError("expected a list of student objects")
+        else:
+            rows = list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid roster: {str(e)}")
+    if len(rows) > ROSTER_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Rosters are limited to {ROSTER_MAX_ROWS} students")
+    return [_normalize(row) for row in rows]
+
+
+async def _free_usernames(db: AsyncSession, wanted: list) -> list:
+    """wanted usernames made unique against the users table and each other"""
+    bases = [re.sub(r"[^A-Za-z0-9_.-]", "", name)[:40] or "student" for name in wanted]
+    names = list(bases)
+    pending = list(range(len(names)))
+    while pending:
+        taken = set((await db.scalars(
+            select(models.User.username).where(models.User.username.in_({names[i] for i in pending}))
+        )).all())
+        seen = set()
+        clashes = []
+        for i in pending:
+            if names[i] in taken or names[i] in seen:
+                clashes.append(i)
+            seen.add(names[i])
+        for i in clashes:
+            names[i] = f"{bases[i]}{random.randint(1000, 9999)}"
+        pending = clashes
+    return names
+
+
+async def _match_users(db: AsyncSession, emails: list) -> dict:
+    """lowercased email -> (user id, role) of the existing users among emails"""
+    if not emails:
+        return {}
+    rows = await db.execute(
+        select(models.User.id, models.User.email, models.User.role).where(func.lower(models.User.email).in_(emails))
+    )
+    return {email.lower(): (user_id, role) for user_id, email, role in rows.all()}
+
+
+async def import_roster(db: AsyncSession, class_id: int, rows: list) -> dict:
+    """Match or create the roster's students and enroll them in class_id.
+
+    Users are matched by email in one query, missing ones are created with
+    one multi-row insert, and enrollments are added with another that skips
+    students already in the class. Accounts registered by someone else
+    while the import runs are matched on a retry. Returns a report with one
+    result per input row.
+    """
+    results = [{"row": index + 1, "email": row["email"]} for index, row in enumerate(rows)]
+    first_rows = {}
+    for result, row in zip(results, rows):
+        email = row["email"].lower()
+        if not EMAIL_PATTERN.match(email):
+            result.update(status="error", detail="Missing or invalid email")
+        elif email in first_rows:
+            result.update(status="error", detail=f"Duplicate of row {first_rows[email] + 1}")
+        else:
+            first_rows[email] = result["row"] - 1
+
+    emails = list(first_rows)
+    # New accounts sign in through Google/Microsoft; password login stays
+    # impossible with a hash of a random secret nobody knows
+    placeholder_password = None
+    created_emails = set()
+    for attempt in range(ROSTER_CREATE_ATTEMPTS):
+        users = await _match_users(db, emails)
+        new_emails = [email for email in emails if email not in users]
+        if not new_emails:
+            break
+        placeholder_password = placeholder_password or await hash_password(secrets.token_urlsafe(32))
+        usernames = await _free_usernames(
+            db, [rows[first_rows[email]]["username"] or email.split("@")[0] for email in new_emails]
+        )
+        try:
+            created = await db.execute(
+                insert(models.User).returning(models.User.id, models.User.email),
+                [
+                    {
+                        "username": username,
+                        "email": email,
+                        "password": placeholder_password,
+                        "first_name": rows[first_rows[email]]["first_name"],
+                        "last_name": rows[first_rows[email]]["last_name"],
+                        "role": models.UserRole.STUDENT
+                    }
+                    for email, username in zip(new_emails, usernames)
+                ]
+            )
+        except IntegrityError:
+            # A signup or provisioning run took one of these emails or
+            # usernames since the checks; nothing is written yet, so start
+            # over and match those accounts instead
+            await db.rollback()
+            continue
+        for user_id, email in created.all():
+            users[email.lower()] = (user_id, models.UserRole.STUDENT)
+        created_emails.update(new_emails)
+        break
+    else:
+        raise HTTPException(status_code=409, detail="Some students were registered concurrently; retry the import")
+
+    student_ids = [user_id for user_id, role in users.values() if role == models.UserRole.STUDENT]
+    # Only rows actually inserted come back, so students enrolled before (or
+    # by a join racing this import) are reported as already enrolled
+    enrolled = set((await db.scalars(
+        insert_ignoring_conflicts(db, models.ClassEnrollment).returning(models.ClassEnrollment.student_id),
+        [{"student_id": user_id, "class_id": class_id} for user_id in student_ids]
+    )).all()) if student_ids else set()
+    await db.commit()
+
+    for email, index in first_rows.items():
+        user_id, role = users[email]
+        result = results[index]
+        result["user_id"] = user_id
+        if role != models.UserRole.STUDENT:
+            result.update(status="error", detail="Account is not a student")
+        elif user_id not in enrolled:
+            result["status"] = "already_enrolled"
+        elif email in created_emails:
+            result["status"] = "created_and_enrolled"
+        else:
+            result["status"] = "enrolled"
+
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"class_id": class_id, "summary": summary, "results": results}
@@ -0,0 +1,122 @@
+# sanitizer.py
+import asyncio
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from cachetools import LRUCache
+
+# Define allowed tags and attributes
+ALLOWED_TAGS = [
+    'p', 'div', 'span', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'strong', 'em', 'u', 'strike', 'br', 'ul', 'ol', 'li',
+    'blockquote', 'pre', 'code', 'hr', 'a', 'img', 'table',
+    'thead', 'tbody', 'tr', 'th', 'td', 'style', 'b', 'i', 's',
+    'font', 'mark', 'del'
+]
+
+ALLOWED_ATTRIBUTES = {
+    '*': ['class', 'style', 'id', 'data-mce-style'],
+    'a': ['href', 'title', 'target'],
+    'img': ['src', 'alt', 'title'],
+    'td': ['colspan', 'rowspan'],
+    'th': ['colspan', 'rowspan', 'scope'],
+    'font': ['color', 'size', 'face'],
+    'p': ['align', 'style'],
+    'div': ['align', 'style'],
+    'span': ['style'],
+    'h1': ['style'],
+    'h2': ['style'],
+    'h3': ['style'],
+    'h4': ['style'],
+    'h5': ['style'],
+    'h6': ['style']
+}
+
+# Define allowed CSS properties
+ALLOWED_STYLES = [
+    'color', 'background-color', 'font-size', 'text-align',
+    'font-family', 'font-weight', 'font-style', 'text-decoration'
+]
+
+# Sanitized output cache, bounded by total characters held
+SANITIZE_CACHE_CHARS = int(os.getenv("SANITIZE_CACHE_CHARS", str(32 * 1024 * 1024)))
+# Posts larger than this are cleaned in the process pool
+SANITIZE_OFFLOAD_CHARS = int(os.getenv("SANITIZE_OFFLOAD_CHARS", str(64 * 1024)))
+SANITIZE_WORKERS = int(os.getenv("SANITIZE_WORKERS", "2"))
+
+
+def build_cleaner():
+    # bleach (and html5lib below it) loads with the first cleaner, not at import
+    import bleach
+    from bleach.css_sanitizer import CSSSanitizer
+
+    return bleach.Cleaner(
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        css_sanitizer=CSSSanitizer(allowed_css_properties=ALLOWED_STYLES),
+        strip=False  # Don't strip tags that aren't in the whitelist
+    )
+
+
+# bleach cleaners keep parser state, so each thread (and process) gets its own
+_local = threading.local()
+
+
+def _clean(content: str) -> str:
+    cleaner = getattr(_local, "cleaner", None)
+    if cleaner is None:
+        cleaner = _local.cleaner = build_cleaner()
+    return cleaner.clean(content)
+
+
+_cache = LRUCache(maxsize=SANITIZE_CACHE_CHARS, getsizeof=len)
+_cache_lock = threading.Lock()
+_executor = None
+
+
+def _key(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _cached(key: str):
+    with _cache_lock:
+        return _cache.get(key)
+
+
+def _store(key: str, sanitized: str):
+    # Entries bigger than the whole cache are simply not kept
+    if len(sanitized) <= SANITIZE_CACHE_CHARS:
+        with _cache_lock:
+            _cache[key] = sanitized
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=SANITIZE_WORKERS)
+    return _executor
+
+
+def sanitize_html(content: str) -> str:
+    """Sanitize post HTML while preserving the allowed inline styles"""
+    key = _key(content)
+    sanitized = _cached(key)
+    if sanitized is None:
+        sanitized = _clean(content)
+        _store(key, sanitized)
+    return sanitized
+
+
+async def sanitize_html_async(content: str) -> str:
+    """sanitize_html for async handlers; large posts are cleaned in a worker process"""
+    if len(content) <= SANITIZE_OFFLOAD_CHARS:
+        return sanitize_html(content)
+
+    key = _key(content)
+    sanitized = _cached(key)
+    if sanitized is None:
+        sanitized = await asyncio.get_running_loop().run_in_executor(_get_executor(), _clean, content)
+        _store(key, sanitized)
+    return sanitized
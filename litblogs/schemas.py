@@ -21,7 +21,10 @@ class BlogCreate(BaseModel):
 class BlogResponse(BaseModel):
     id: int
     title: str
-    content: str
+    content: str | None = None  # Omitted by view=summary
+    excerpt: str | None = None
+    word_count: int = 0
+    reading_time: int = 0
     created_at: datetime
     owner_id: int
     class_id: int
@@ -32,6 +35,13 @@ class BlogResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BlogPage(BaseModel):
+    items: List[BlogResponse]
+    next_cursor: str | None = None
+
+class BlogDetailResponse(BlogResponse):
+    blocks: List[dict] | None = None
+
 # User schemas
 class UserRole(str, Enum):
     STUDENT = "student"
@@ -59,6 +69,17 @@ class UserCreate(BaseModel):
             raise ValueError('Invalid role')
         return v
 
+class UserProvision(BaseModel):
+    username: str
+    email: str
+    password: str | None = None  # Generated and returned when omitted
+    first_name: str | None = None
+    last_name: str | None = None
+    role: str = "STUDENT"
+
+class UserProvisionBatch(BaseModel):
+    users: List[UserProvision]
+
 class ClassInfo(BaseModel):
     id: int
     name: str
@@ -0,0 +1,301 @@
+# search.py
+import asyncio
+import math
+import re
+import threading
+from collections import Counter
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, literal_column, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from database import async_engine
+from pagination import PageParams, InvalidCursor, build_page, decode_cursor, paginate
+from rich_content import plain_text
+
+# Postgres ranks with ts_rank over models.search_vector; anything else
+# (SQLite in tests and small installs) uses the in-process index below
+POSTGRES_SEARCH = async_engine.dialect.name == "postgresql"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the this to was were with".split()
+)
+# Relative weight of a term found in each field, like the A/B/C tsvector weights
+FIELD_WEIGHTS = {"title": 3.0, "content": 1.0, "comments": 0.5}
+
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+# Write-path statements, executed in the caller's transaction
+
+def search_document(post_id: int, class_id: int, title: str, content: str) -> dict:
+    """Search document fields for a post; content is the post's sanitized HTML"""
+    return {"post_id": post_id, "class_id": class_id, "title": title, "content": plain_text(content)}
+
+
+def document_insert(document: dict):
+    return insert(models.SearchDocument).values(**document, comments="")
+
+
+def document_update(document: dict):
+    return update(models.SearchDocument).where(
+        models.SearchDocument.post_id == document["post_id"]
+    ).values(title=document["title"], content=document["content"])
+
+
+def document_append_comment(post_id: int, comment: str):
+    return update(models.SearchDocument).where(models.SearchDocument.post_id == post_id).values(
+        comments=models.SearchDocument.comments + " " + plain_text(comment)
+    )
+
+
+def document_delete(post_id: int):
+    return delete(models.SearchDocument).where(models.SearchDocument.post_id == post_id)
+
+
+class LocalSearchIndex:
+    """In-process inverted index over the search documents.
+
+    Loaded from the search_documents table on the first search. Each worker
+    has its own copy: its own writes are applied directly, and before each
+    search the classes whose Class.version moved (posts and comments written
+    through any worker bump it) are re-read from the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = None
+        self._state = "empty"
+        # Writes that arrive while the table is being read, replayed after it
+        self._pending = []
+        self._postings = {}
+        self._docs = {}
+        # Class.version of each class as of its documents' last read
+        self._class_versions = {}
+
+    def _index(self, post_id: int, class_id: int, fields: dict):
+        old = self._docs.get(post_id)
+        counts = dict(old[1]) if old else {}
+        counts.update({field: Counter(tokenize(text)) for field, text in fields.items()})
+        self._unindex(post_id)
+        self._docs[post_id] = (class_id, counts)
+        for terms in counts.values():
+            for term in terms:
+                self._postings.setdefault(term, set()).add(post_id)
+
+    def _unindex(self, post_id: int):
+        old = self._docs.pop(post_id, None)
+        if old is None:
+            return
+        for terms in old[1].values():
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.discard(post_id)
+                    if not postings:
+                        del self._postings[term]
+
+    def _add_comment(self, post_id: int, comment: str):
+        doc = self._docs.get(post_id)
+        if doc is None:
+            return
+        doc[1]["comments"] = doc[1].get("comments", Counter()) + Counter(tokenize(comment))
+        for term in doc[1]["comments"]:
+            self._postings.setdefault(term, set()).add(post_id)
+
+    def _apply(self, operation, *args):
+        with self._lock:
+            if self._state == "ready":
+                operation(*args)
+            elif self._state == "loading":
+                self._pending.append((operation, args))
+
+    def put(self, document: dict):
+        """Index a new or edited post (its comments are kept)"""
+        fields = {"title": document["title"], "content": document["content"]}
+        self._apply(self._index, document["post_id"], document["class_id"], fields)
+
+    def add_comment(self, post_id: int, comment: str):
+        self._apply(self._add_comment, post_id, plain_text(comment))
+
+    def remove(self, post_id: int):
+        self._apply(self._unindex, post_id)
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self._state == "ready":
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if self._state == "ready":
+                return
+            with self._lock:
+                self._state = "loading"
+            # Versions first: documents read afterwards are at least that new
+            versions = dict((await db.execute(select(models.Class.id, models.Class.version))).all())
+            documents = models.SearchDocument
+            rows = (await db.execute(
+                select(documents.post_id, documents.class_id, documents.title, documents.content, documents.comments)
+            )).all()
+            with self._lock:
+                for row in rows:
+                    self._index(row.post_id, row.class_id, {
+                        "title": row.title, "content": row.content, "comments": row.comments
+                    })
+                for operation, args in self._pending:
+                    operation(*args)
+                self._pending = []
+                self._class_versions = versions
+                self._state = "ready"
+
+    async def refresh(self, db: AsyncSession, class_ids: set):
+        """Re-read the documents of any of class_ids written since they were last read"""
+        if not class_ids:
+            return
+        versions = dict((await db.execute(
+            select(models.Class.id, models.Class.version).where(models.Class.id.in_(class_ids))
+        )).all())
+        with self._lock:
+            stale = {class_id for class_id, version in versions.items() if self._class_versions.get(class_id) != version}
+        if not stale:
+            return
+        documents = models.SearchDocument
+        rows = (await db.execute(
+            select(documents.post_id, documents.class_id, documents.title, documents.content, documents.comments).where(
+                documents.class_id.in_(stale)
+            )
+        )).all()
+        with self._lock:
+            for post_id in [post_id for post_id, (class_id, _) in self._docs.items() if class_id in stale]:
+                self._unindex(post_id)
+            for row in rows:
+                self._index(row.post_id, row.class_id, {
+                    "title": row.title, "content": row.content, "comments": row.comments
+                })
+            self._class_versions.update({class_id: versions[class_id] for class_id in stale})
+
+    def search(self, terms: list, class_ids: set) -> list:
+        """(score, post_id) of documents in class_ids containing every term, best first"""
+        with self._lock:
+            if not terms:
+                return []
+            matches = set.intersection(*(self._postings.get(term, set()) for term in terms))
+            total = len(self._docs)
+            idf = {term: math.log(1 + total / len(self._postings[term])) for term in terms} if matches else {}
+            hits = []
+            for post_id in matches:
+                class_id, counts = self._docs[post_id]
+                if class_id not in class_ids:
+                    continue
+                length = sum(sum(field.values()) for field in counts.values())
+                weighted = sum(
+                    idf[term] * sum(FIELD_WEIGHTS[field] * counts[field][term] for field in counts)
+                    for term in terms
+                )
+                hits.append((round(weighted / math.sqrt(length or 1), 6), post_id))
+        hits.sort(reverse=True)
+        return hits
+
+
+local_index = LocalSearchIndex()
+
+
+def _result_columns():
+    return (
+        models.Blog.id,
+        models.Blog.class_id,
+        models.Blog.title,
+        models.Blog.excerpt,
+        models.Blog.created_at
+    )
+
+
+async def _search_postgres(db: AsyncSession, text: str, scope, page: PageParams):
+    documents = models.SearchDocument
+    vector = models.search_vector(documents.title, documents.content, documents.comments)
+    tsquery = func.websearch_to_tsquery(literal_column("'english'"), text)
+    rank = func.ts_rank(vector, tsquery)
+    query = select(*_result_columns(), rank.label("rank")).join(
+        documents, documents.post_id == models.Blog.id
+    ).where(
+        vector.op("@@")(tsquery),
+        documents.class_id.in_(scope)
+    )
+    rows = (await db.execute(paginate(query, [rank, models.Blog.id], page, descending=True))).all()
+    return build_page(rows, page, key=lambda row: (row.rank, row.id), format_item=lambda row: row._asdict())
+
+
+async def _search_local(db: AsyncSession, text: str, scope, page: PageParams):
+    await local_index.ensure_loaded(db)
+    class_ids = set((await db.scalars(scope)).all())
+    await local_index.refresh(db, class_ids)
+    hits = local_index.search(tokenize(text), class_ids)
+    if page.cursor:
+        try:
+            after = decode_cursor(page.cursor)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        hits = [hit for hit in hits if hit < tuple(after)]
+    hits = hits[:page.size + 1]
+
+    ranks = {post_id: score for score, post_id in hits}
+    rows = (await db.execute(select(*_result_columns()).where(models.Blog.id.in_(ranks)))).all() if ranks else []
+    items = sorted(
+        ({**row._asdict(), "rank": ranks[row.id]} for row in rows),
+        key=lambda item: (item["rank"], item["id"]),
+        reverse=True
+    )
+    return build_page(items, page, key=lambda item: (item["rank"], item["id"]), format_item=lambda item: item)
+
+
+async def search_posts(db: AsyncSession, text: str, scope, page: PageParams) -> dict:
+    """Ranked page of posts matching text in the classes selected by scope.
+
+    Results are always paged: {"items": [...], "next_cursor": ...}.
+    """
+    page = PageParams(cursor=page.cursor, limit=page.size)
+    if POSTGRES_SEARCH:
+        return await _search_postgres(db, text, scope, page)
+    return await _search_local(db, text, scope, page)
+
+
+def rebuild_documents(db: Session, batch_size: int = 200) -> int:
+    """Recreate every search document from the posts and comments tables"""
+    db.execute(delete(models.SearchDocument))
+    rebuilt = 0
+    last_id = 0
+    while True:
+        posts = db.query(models.Blog).filter(models.Blog.id > last_id).order_by(models.Blog.id).limit(batch_size).all()
+        if not posts:
+            break
+        comments = {}
+        for blog_id, content in db.query(models.Comment.blog_id, models.Comment.content).filter(
+            models.Comment.blog_id.in_([post.id for post in posts])
+        ).order_by(models.Comment.id):
+            comments.setdefault(blog_id, []).append(plain_text(content))
+        db.execute(insert(models.SearchDocument), [
+            {
+                **search_document(post.id, post.class_id, post.title, post.content),
+                "comments": " ".join(comments.get(post.id, []))
+            }
+            for post in posts
+        ])
+        rebuilt += len(posts)
+        last_id = posts[-1].id
+    db.commit()
+    return rebuilt
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Rebuilt {rebuild_documents(db)} search documents")
+    finally:
+        db.close()
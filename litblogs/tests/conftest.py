@@ -0,0 +1,40 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from dotenv import dotenv_values
+from sqlalchemy.engine import make_url
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+
+def _same_database(a: str, b: str) -> bool:
+    a, b = make_url(a), make_url(b)
+    return (a.get_backend_name(), a.host, a.port, a.database) == (b.get_backend_name(), b.host, b.port, b.database)
+
+
+# main reads its settings at import time; tests never touch the configured
+# database. TEST_DATABASE_URL opts in to a throwaway database (e.g. Postgres,
+# for the query-plan checks); otherwise each run gets a new SQLite file
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+configured = os.getenv("DATABASE_URL") or dotenv_values(APP_DIR / ".env").get("DATABASE_URL")
+if TEST_DATABASE_URL and configured and _same_database(TEST_DATABASE_URL, configured):
+    pytest.exit("TEST_DATABASE_URL is the app's DATABASE_URL; point the tests at a throwaway database", returncode=2)
+os.environ["DATABASE_URL"] = TEST_DATABASE_URL or f"sqlite:///{tempfile.mkdtemp(prefix='litblogs-tests-')}/test.db"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+sys.path.insert(0, str(APP_DIR))
+# The /uploads mount and /api/download resolve "uploads" against the working directory
+os.chdir(APP_DIR)
+
+
+@pytest.fixture
+def app():
+    import main
+
+    yield main.app
+    main.app.dependency_overrides.clear()
@@ -0,0 +1,156 @@
+# tests/test_media.py
+import asyncio
+import os
+import secrets
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+import models
+from media import ZEROCOPY_EXTENSION, MediaFileResponse
+from principals import Principal
+
+CONTENT = bytes(range(256)) * 4
+SIZE = len(CONTENT)
+
+
+@pytest.fixture
+def media_path():
+    path = Path("uploads") / "files" / f"test_media_{secrets.token_hex(4)}.bin"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(CONTENT)
+    yield path
+    path.unlink()
+
+
+@pytest.fixture
+def client(app):
+    import main
+
+    user = Principal(
+        id=1, username="reader", email="reader@example.com", first_name=None, last_name=None,
+        role=models.UserRole.STUDENT, is_admin=False, created_at=datetime.utcnow(),
+        bio=None, profile_image=None, cover_image=None
+    )
+    app.dependency_overrides[main.get_current_user] = lambda: user
+    return TestClient(app)
+
+
+@pytest.fixture(params=["uploads", "download"])
+def url(request, media_path):
+    if request.param == "uploads":
+        return f"/{media_path.as_posix()}"
+    return f"/api/download?url=/{media_path.as_posix()}&filename={media_path.name}"
+
+
+def test_full_response_has_validators(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"]
+    assert response.headers["last-modified"]
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=10-19", 10, 20),
+    ("bytes=-100", SIZE - 100, SIZE),
+    ("bytes=1000-", 1000, SIZE),
+    ("bytes=1000-99999", 1000, SIZE),
+])
+def test_single_range(client, url, range_header, start, end):
+    response = client.get(url, headers={"Range": range_header})
+    assert response.status_code == 206
+    assert response.content == CONTENT[start:end]
+    assert response.headers["content-range"] == f"bytes {start}-{end - 1}/{SIZE}"
+    assert response.headers["content-length"] == str(end - start)
+
+
+def test_unsatisfiable_range(client, url):
+    response = client.get(url, headers={"Range": f"bytes={SIZE}-{SIZE + 100}"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{SIZE}"
+
+
+def test_if_range_with_current_etag_serves_the_range(client, url):
+    etag = client.get(url).headers["etag"]
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.content == CONTENT[:10]
+
+
+def test_if_range_with_stale_etag_serves_the_whole_file(client, url):
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_none_match_gives_304(client, url):
+    first = client.get(url)
+    response = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == first.headers["etag"]
+    assert response.headers["cache-control"] == first.headers["cache-control"]
+
+
+def test_if_modified_since_gives_304(client, url):
+    last_modified = client.get(url).headers["last-modified"]
+    response = client.get(url, headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+
+def test_changed_file_is_served_again(client, url, media_path):
+    etag = client.get(url).headers["etag"]
+    media_path.write_bytes(CONTENT[::-1] + b"!")
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.content == CONTENT[::-1] + b"!"
+
+
+def send_zerocopy(path, method="GET", headers=()):
+    """Messages MediaFileResponse sends to a server offering the zero-copy extension"""
+    scope = {
+        "type": "http", "method": method, "path": "/", "query_string": b"",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "extensions": {ZEROCOPY_EXTENSION: {}}
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == ZEROCOPY_EXTENSION:
+            # The response closes the file after sending; record that it was open
+            message = {**message, "closed": message["file"].closed}
+        messages.append(message)
+
+    response = MediaFileResponse(path, stat_result=os.stat(path))
+    asyncio.run(response(scope, receive, send))
+    return messages
+
+
+@pytest.mark.parametrize("range_header, status, offset, count", [
+    (None, 200, 0, SIZE),
+    ("bytes=-100", 206, SIZE - 100, 100),
+    ("bytes=1000-", 206, 1000, SIZE - 1000),
+])
+def test_zerocopy_sends_offset_and_count(media_path, range_header, status, offset, count):
+    start, body = send_zerocopy(media_path, headers=[("Range", range_header)] if range_header else [])
+    assert start["status"] == status
+    headers = dict(start["headers"])
+    assert headers[b"content-length"] == str(count).encode()
+    if range_header:
+        assert headers[b"content-range"] == f"bytes {offset}-{offset + count - 1}/{SIZE}".encode()
+    assert body["type"] == ZEROCOPY_EXTENSION
+    assert (body["offset"], body["count"], body["more_body"]) == (offset, count, False)
+    assert not body["closed"]
+
+
+def test_zerocopy_head_sends_no_file(media_path):
+    messages = send_zerocopy(media_path, method="HEAD")
+    assert [message["type"] for message in messages] == ["http.response.start", "http.response.body"]
+    assert messages[1]["body"] == b""
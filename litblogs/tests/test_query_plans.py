@@ -0,0 +1,304 @@
+# tests/test_query_plans.py
+"""Query-plan regression checks for the hot endpoints.
+
+Seeds a dataset, calls each endpoint in-process while capturing every
+SELECT/WITH/UPDATE/DELETE it runs, and explains each statement (EXPLAIN
+QUERY PLAN on SQLite, EXPLAIN on Postgres). A plan fails when it scans a
+whole large table, or on Postgres when its estimated total cost is over
+QUERY_PLANS_COST_BUDGET.
+
+SQLite runs a small dataset; with TEST_DATABASE_URL pointing at a
+throwaway Postgres database the dataset is production-sized, since the
+Postgres planner rightly prefers sequential scans of tiny tables.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import secrets
+from collections import Counter
+
+import pytest
+from sqlalchemy import bindparam, delete, event, insert, select, text, update
+from sqlalchemy.orm import Session
+
+import models
+from principals import Principal
+
+# Tables that grow with usage; small ones (classes, teachers) may be scanned
+LARGE_TABLES = {
+    "users", "blogs", "comments", "post_likes", "comment_likes",
+    "class_enrollments", "search_documents", "user_uploads"
+}
+CAPTURED = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE)\b", re.IGNORECASE)
+COST_BUDGET = float(os.getenv("QUERY_PLANS_COST_BUDGET", "5000"))
+DATASETS = {
+    "sqlite": dict(teachers=10, classes=40, students=1000, class_size=50, posts=3000, comments=9000, likes=6000),
+    "postgresql": dict(teachers=50, classes=200, students=5000, class_size=75, posts=20000, comments=60000, likes=50000),
+}
+
+
+class StatementCapture:
+    """Statements run on both engines while capturing"""
+
+    def __init__(self, engine, async_engine):
+        self.statements = []
+        self.active = False
+        self._listeners = [(engine, self._sync), (async_engine.sync_engine, self._async)]
+        for target, listener in self._listeners:
+            event.listen(target, "before_cursor_execute", listener)
+
+    def close(self):
+        for target, listener in self._listeners:
+            event.remove(target, "before_cursor_execute", listener)
+
+    def _record(self, kind, statement, parameters, executemany):
+        if self.active and not executemany and CAPTURED.match(statement):
+            self.statements.append((kind, statement, parameters))
+
+    def _sync(self, conn, cursor, statement, parameters, context, executemany):
+        self._record("sync", statement, parameters, executemany)
+
+    def _async(self, conn, cursor, statement, parameters, context, executemany):
+        self._record("async", statement, parameters, executemany)
+
+    def take(self) -> list:
+        """Distinct statements captured since the last take"""
+        statements, self.statements = self.statements, []
+        distinct = {}
+        for kind, statement, parameters in statements:
+            distinct.setdefault((kind, statement, repr(parameters)), (kind, statement, parameters))
+        return list(distinct.values())
+
+
+def _postgres_problems(rows) -> list:
+    plan = rows[0][0]
+    plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    problems = []
+    if plan["Total Cost"] > COST_BUDGET:
+        problems.append(f"estimated cost {plan['Total Cost']:.0f} > budget {COST_BUDGET:g}")
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES:
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+        nodes.extend(node.get("Plans", ()))
+    return problems
+
+
+def _sqlite_problems(rows) -> list:
+    problems = []
+    for row in rows:
+        detail = row[-1]
+        match = re.match(r"SCAN (?:TABLE )?(\w+)", detail)
+        if match and "USING" not in detail and re.sub(r"_\d+$", "", match.group(1)) in LARGE_TABLES:
+            problems.append(detail)
+    return problems
+
+
+async def explain(engine, async_engine, kind: str, statement: str, parameters) -> list:
+    """Plan problems for one captured statement, as strings"""
+    postgres = engine.dialect.name == "postgresql"
+    prefix = "EXPLAIN (FORMAT JSON) " if postgres else "EXPLAIN QUERY PLAN "
+    if kind == "async":
+        async with async_engine.connect() as connection:
+            rows = (await connection.exec_driver_sql(prefix + statement, parameters)).all()
+    else:
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + statement, parameters).all()
+    return _postgres_problems(rows) if postgres else _sqlite_problems(rows)
+
+
+def seed(engine, sizes: dict, rng: random.Random) -> dict:
+    """Insert the dataset with multi-row statements; returns the ids the checks need"""
+    tag = secrets.token_hex(4)
+    with engine.begin() as db:
+        def rows(model, values, returning=None):
+            statement = insert(model)
+            if returning is not None:
+                # Ids in the order of values, which the fixtures below rely on
+                return [row[0] for row in db.execute(statement.returning(returning, sort_by_parameter_order=True), values)]
+            if values:
+                db.execute(statement, values)
+
+        user_ids = rows(models.User, [
+            {
+                "username": f"plans_{tag}_{i}", "email": f"plans_{tag}_{i}@example.com", "password": "x",
+                "role": models.UserRole.TEACHER if i < sizes["teachers"] else models.UserRole.STUDENT
+            }
+            for i in range(sizes["teachers"] + sizes["students"])
+        ], models.User.id)
+        teacher_user_ids, student_ids = user_ids[:sizes["teachers"]], user_ids[sizes["teachers"]:]
+        teacher_ids = rows(models.Teacher, [
+            {"name": f"plans {tag} {i}", "email": f"plans_{tag}_{i}@example.com", "user_id": user_id}
+            for i, user_id in enumerate(teacher_user_ids)
+        ], models.Teacher.id)
+        class_ids = rows(models.Class, [
+            {"name": f"plans {tag} {i}", "access_code": secrets.token_hex(3).upper(), "teacher_id": teacher_ids[i % len(teacher_ids)]}
+            for i in range(sizes["classes"])
+        ], models.Class.id)
+
+        members = {class_id: rng.sample(student_ids, min(len(student_ids), sizes["class_size"])) for class_id in class_ids}
+        rows(models.ClassEnrollment, [
+            {"student_id": student_id, "class_id": class_id}
+            for class_id, students in members.items() for student_id in students
+        ])
+
+        post_classes = [rng.choice(class_ids) for _ in range(sizes["posts"])]
+        posts = [(class_id, rng.choice(members[class_id])) for class_id in post_classes]
+        post_ids = rows(models.Blog, [
+            {
+                "title": f"Post {i}", "content": "<p>Seeded post</p>", "excerpt": "Seeded post",
+                "owner_id": owner_id, "class_id": class_id
+            }
+            for i, (class_id, owner_id) in enumerate(posts)
+        ], models.Blog.id)
+        post_class = dict(zip(post_ids, (class_id for class_id, _ in posts)))
+
+        comment_posts = [rng.choice(post_ids) for _ in range(sizes["comments"])]
+        comment_ids = rows(models.Comment, [
+            {"content": "Seeded comment", "user_id": rng.choice(members[post_class[post_id]]), "blog_id": post_id}
+            for post_id in comment_posts
+        ], models.Comment.id)
+        # A third of the comments become replies to an earlier comment on the same post
+        first_comment = {}
+        replies = []
+        for comment_id, post_id in zip(comment_ids, comment_posts):
+            if post_id in first_comment and rng.random() < 1 / 3:
+                replies.append({"comment_id": comment_id, "parent": first_comment[post_id]})
+            first_comment.setdefault(post_id, comment_id)
+        if replies:
+            comments = models.Comment.__table__
+            db.execute(
+                update(comments).where(comments.c.id == bindparam("comment_id")).values(parent_id=bindparam("parent")),
+                replies
+            )
+
+        post_likes = {(rng.choice(post_ids), rng.choice(student_ids)) for _ in range(sizes["likes"])}
+        rows(models.PostLike, [{"post_id": post_id, "user_id": user_id} for post_id, user_id in post_likes])
+        comment_likes = {(rng.choice(comment_ids), rng.choice(student_ids)) for _ in range(sizes["likes"] // 2)}
+        rows(models.CommentLike, [{"comment_id": comment_id, "user_id": user_id} for comment_id, user_id in comment_likes])
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as db:
+        # Fresh planner statistics, as production tables would have
+        db.execute(text("ANALYZE"))
+
+    # The checks run against the class with the most posts and its most commented post
+    busiest_class = Counter(class_id for class_id, _ in posts).most_common(1)[0][0]
+    comment_counts = Counter(comment_posts)
+    busiest_post = max(
+        (post_id for post_id in post_ids if post_class[post_id] == busiest_class),
+        key=lambda post_id: comment_counts[post_id]
+    )
+    return {
+        "class_id": busiest_class,
+        "post_id": busiest_post,
+        "student_id": members[busiest_class][0],
+        "teacher_user_id": teacher_user_ids[class_ids.index(busiest_class) % len(teacher_ids)],
+        "roster_emails": [f"plans_{tag}_{user_ids.index(student_id)}@example.com" for student_id in members[busiest_class]],
+        "class_ids": class_ids,
+        "user_ids": user_ids
+    }
+
+
+def remove(engine, fixtures: dict):
+    with engine.begin() as db:
+        post_ids = select(models.Blog.id).where(models.Blog.class_id.in_(fixtures["class_ids"]))
+        comment_ids = select(models.Comment.id).where(models.Comment.blog_id.in_(post_ids))
+        db.execute(delete(models.CommentLike).where(models.CommentLike.comment_id.in_(comment_ids)))
+        db.execute(update(models.Comment.__table__).where(models.Comment.blog_id.in_(post_ids)).values(parent_id=None))
+        db.execute(delete(models.Comment).where(models.Comment.blog_id.in_(post_ids)))
+        db.execute(delete(models.PostLike).where(models.PostLike.post_id.in_(post_ids)))
+        db.execute(delete(models.SearchDocument).where(models.SearchDocument.class_id.in_(fixtures["class_ids"])))
+        db.execute(delete(models.Blog).where(models.Blog.class_id.in_(fixtures["class_ids"])))
+        db.execute(delete(models.ClassEnrollment).where(models.ClassEnrollment.class_id.in_(fixtures["class_ids"])))
+        db.execute(delete(models.Class).where(models.Class.id.in_(fixtures["class_ids"])))
+        db.execute(delete(models.Teacher).where(models.Teacher.user_id.in_(fixtures["user_ids"])))
+        db.execute(delete(models.User).where(models.User.id.in_(fixtures["user_ids"])))
+
+
+async def call(app, method: str, path: str, body: bytes = b"", content_type: str = "") -> int:
+    """Run one request through the ASGI app; returns the status code"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", content_type.encode())] if content_type else [],
+        "client": ("127.0.0.1", 0), "server": ("localhost", 80)
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    from database import async_engine, engine
+    from migrations import migrate
+
+    migrate(engine)
+    fixtures = seed(engine, DATASETS[engine.dialect.name], random.Random(1))
+    capture = StatementCapture(engine, async_engine)
+    try:
+        yield engine, async_engine, capture, fixtures
+    finally:
+        capture.close()
+        remove(engine, fixtures)
+
+
+def principal(engine, user_id: int) -> Principal:
+    with Session(engine) as db:
+        return Principal.from_user(db.get(models.User, user_id))
+
+
+CHECKS = {
+    "get_class_posts": ("student_id", "GET", "{class_path}/posts"),
+    "get_comments": ("student_id", "GET", "{post_path}/comments"),
+    "get_teacher_dashboard": ("teacher_user_id", "GET", "/api/teacher/dashboard"),
+    "get_class_students": ("teacher_user_id", "GET", "{class_path}/students"),
+    "like_post": ("student_id", "POST", "{post_path}/like"),
+    # Every student is already enrolled, so the import only matches and skips them
+    "import_class_roster": ("teacher_user_id", "POST", "{class_path}/roster"),
+}
+
+
+@pytest.mark.parametrize("name", CHECKS)
+def test_hot_endpoint_plans(app, dataset, name):
+    import main
+
+    engine, async_engine, capture, fixtures = dataset
+    user_key, method, path = CHECKS[name]
+    class_path = f"/api/classes/{fixtures['class_id']}"
+    path = path.format(class_path=class_path, post_path=f"{class_path}/posts/{fixtures['post_id']}")
+    current_user = principal(engine, fixtures[user_key])
+    app.dependency_overrides[main.get_current_user] = lambda: current_user
+    body = "email\n" + "\n".join(fixtures["roster_emails"]) if name == "import_class_roster" else ""
+
+    async def run():
+        try:
+            capture.active = True
+            status = await call(app, method, path, body.encode(), "text/csv" if body else "")
+            capture.active = False
+            statements = capture.take()
+            problems = []
+            for kind, statement, parameters in statements:
+                for problem in await explain(engine, async_engine, kind, statement, parameters):
+                    problems.append(f"{problem}: {' '.join(statement.split())[:200]}")
+            return status, statements, problems
+        finally:
+            capture.active = False
+            # Pooled async connections belong to this event loop
+            await async_engine.dispose()
+
+    status, statements, problems = asyncio.run(run())
+    assert status < 400
+    assert statements
+    assert not problems, "\n".join(problems)
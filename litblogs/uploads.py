@@ -0,0 +1,304 @@
+# uploads.py
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from media import media_response
+
+UPLOAD_DIR = Path("uploads")
+# Content-addressed blobs live under uploads/blobs/<2 hex>/<sha256><ext>
+BLOB_DIR = UPLOAD_DIR / "blobs"
+TMP_DIR = UPLOAD_DIR / "tmp"
+# A blob URL always names the same bytes, so browsers may keep it forever
+BLOB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Other uploads may be replaced or deleted, so caches revalidate them daily
+UPLOAD_CACHE_CONTROL = "public, max-age=86400"
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_WRITE_WORKERS = int(os.getenv("UPLOAD_WRITE_WORKERS", "4"))
+
+MB = 1024 * 1024
+
+# Largest accepted upload per kind, enforced while the body streams in
+UPLOAD_LIMITS = {
+    "image": int(os.getenv("UPLOAD_LIMIT_IMAGE", str(10 * MB))),
+    "video": int(os.getenv("UPLOAD_LIMIT_VIDEO", str(500 * MB))),
+    "file": int(os.getenv("UPLOAD_LIMIT_FILE", str(50 * MB))),
+    "avatar": int(os.getenv("UPLOAD_LIMIT_AVATAR", str(5 * MB)))
+}
+
+
+@dataclass
+class StoredUpload:
+    path: Path
+    size: int
+    sha256: str
+    seconds: float
+
+
+@dataclass
+class StoredBlob:
+    url: str
+    filename: str
+    size: int
+    sha256: str
+    deduplicated: bool
+
+
+class UploadMetrics:
+    """Throughput of the upload pipeline"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.rejected = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+        self.bytes_total = 0
+        self.seconds_total = 0.0
+        self.last_bytes_per_sec = 0.0
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, size: int, seconds: float):
+        with self._lock:
+            self.in_flight -= 1
+            self.uploads += 1
+            self.bytes_total += size
+            self.seconds_total += seconds
+            self.last_bytes_per_sec = size / seconds if seconds else 0.0
+
+    def record_duplicate(self, size: int):
+        with self._lock:
+            self.deduplicated += 1
+            self.bytes_saved += size
+
+    def abort(self, rejected: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if rejected:
+                self.rejected += 1
+            else:
+                self.failed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "chunk_size": UPLOAD_CHUNK_SIZE,
+                "write_workers": UPLOAD_WRITE_WORKERS,
+                "limits": UPLOAD_LIMITS,
+                "uploads": self.uploads,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "in_flight": self.in_flight,
+                "deduplicated": self.deduplicated,
+                "bytes_saved": self.bytes_saved,
+                "bytes_total": self.bytes_total,
+                "avg_bytes_per_sec": round(self.bytes_total / self.seconds_total) if self.seconds_total else 0,
+                "last_bytes_per_sec": round(self.last_bytes_per_sec)
+            }
+
+
+upload_metrics = UploadMetrics()
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=UPLOAD_WRITE_WORKERS, thread_name_prefix="upload")
+    return _executor
+
+
+def _write_chunk(handle, hasher, chunk: bytes):
+    # Hashing happens next to the write so the event loop only moves bytes
+    hasher.update(chunk)
+    handle.write(chunk)
+
+
+def _discard(path: Path):
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def safe_filename(filename: str) -> str:
+    """Client filename without any directory components"""
+    return Path(filename or "upload").name or "upload"
+
+
+async def _run(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), func, *args)
+
+
+def _move(source: Path, destination: Path):
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    source.replace(destination)
+
+
+async def save_upload(file: UploadFile, destination: Optional[Path], kind: str, partial: Optional[Path] = None) -> StoredUpload:
+    """Stream an upload to destination in chunks without blocking the event loop.
+
+    Raises HTTPException 413 as soon as the body exceeds the limit for kind;
+    nothing is left on disk for rejected or failed uploads. Without a
+    destination the data stays in partial for the caller to place.
+    """
+    limit = UPLOAD_LIMITS[kind]
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    partial = partial or destination.with_name(destination.name + ".part")
+    hasher = hashlib.sha256()
+    size = 0
+
+    upload_metrics.start()
+    started_at = time.perf_counter()
+    try:
+        await loop.run_in_executor(executor, lambda: partial.parent.mkdir(parents=True, exist_ok=True))
+        handle = await loop.run_in_executor(executor, partial.open, "wb")
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"{kind.capitalize()} uploads are limited to {limit // MB} MB"
+                    )
+                await loop.run_in_executor(executor, _write_chunk, handle, hasher, chunk)
+        finally:
+            await loop.run_in_executor(executor, handle.close)
+        if destination is not None:
+            await loop.run_in_executor(executor, partial.replace, destination)
+    except BaseException as e:
+        await loop.run_in_executor(executor, _discard, partial)
+        upload_metrics.abort(rejected=isinstance(e, HTTPException))
+        raise
+
+    seconds = time.perf_counter() - started_at
+    upload_metrics.finish(size, seconds)
+    return StoredUpload(path=destination or partial, size=size, sha256=hasher.hexdigest(), seconds=seconds)
+
+
+def blob_path(sha256: str, filename: str) -> str:
+    """Path of a blob relative to UPLOAD_DIR; the extension lets /uploads pick a content type"""
+    extension = Path(filename).suffix.lower()
+    if not (1 < len(extension) <= 10 and extension[1:].isalnum()):
+        extension = ""
+    return f"{BLOB_DIR.name}/{sha256[:2]}/{sha256}{extension}"
+
+
+async def store_blob(db: AsyncSession, file: UploadFile, kind: str, user_id: int) -> StoredBlob:
+    """Store an upload content-addressed and record the user's reference to it.
+
+    Content that is already stored is not written again: the upload only
+    adds a UserUpload row (or reuses the user's existing one).
+    """
+    filename = safe_filename(file.filename)
+    partial = TMP_DIR / f"{uuid.uuid4().hex}.part"
+    stored = await save_upload(file, None, kind, partial=partial)
+    try:
+        blob = await db.get(models.Blob, stored.sha256)
+        deduplicated = blob is not None
+        if blob is None:
+            blob = models.Blob(sha256=stored.sha256, path=blob_path(stored.sha256, filename), size=stored.size)
+            db.add(blob)
+            try:
+                await db.flush()
+            except IntegrityError:
+                # The same content was stored by a concurrent upload
+                await db.rollback()
+                blob = await db.get(models.Blob, stored.sha256)
+                deduplicated = True
+        path = blob.path
+        needs_file = not deduplicated or not await _run((UPLOAD_DIR / path).exists)
+
+        reference = await db.scalar(
+            select(models.UserUpload).where(
+                models.UserUpload.user_id == user_id,
+                models.UserUpload.sha256 == stored.sha256
+            )
+        )
+        if reference is None:
+            db.add(models.UserUpload(user_id=user_id, sha256=stored.sha256, filename=filename, kind=kind))
+        await db.commit()
+        # The file is moved in only once its row is committed, so a failed commit
+        # leaves no orphan on disk; a row whose move failed is repaired by the
+        # next upload of the same content
+        if needs_file:
+            await _run(_move, partial, UPLOAD_DIR / path)
+    finally:
+        await _run(_discard, partial)
+
+    if deduplicated:
+        upload_metrics.record_duplicate(stored.size)
+    return StoredBlob(
+        url=f"/{UPLOAD_DIR.name}/{path}",
+        filename=filename,
+        size=stored.size,
+        sha256=stored.sha256,
+        deduplicated=deduplicated
+    )
+
+
+async def release_blob(db: AsyncSession, user_id: int, sha256: str) -> bool:
+    """Drop the user's reference to a blob, deleting the blob once nobody references it.
+
+    Returns False if the user held no reference.
+    """
+    result = await db.execute(
+        delete(models.UserUpload).where(
+            models.UserUpload.user_id == user_id,
+            models.UserUpload.sha256 == sha256
+        )
+    )
+    if not result.rowcount:
+        return False
+
+    remaining = await db.scalar(
+        select(func.count()).select_from(models.UserUpload).where(models.UserUpload.sha256 == sha256)
+    )
+    blob = await db.get(models.Blob, sha256) if not remaining else None
+    if blob is not None:
+        await db.delete(blob)
+    await db.commit()
+    if blob is not None:
+        await _run(_discard, UPLOAD_DIR / blob.path)
+    return True
+
+
+class UploadFiles(StaticFiles):
+    """The /uploads mount: ranges, validators and sendfile via media_response,
+    with far-future immutable caching for blobs"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._blob_root = os.path.realpath(BLOB_DIR) + os.sep
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        is_blob = os.fspath(full_path).startswith(self._blob_root)
+        return media_response(
+            Headers(scope=scope),
+            full_path,
+            method=scope["method"],
+            status_code=status_code,
+            headers={"Cache-Control": BLOB_CACHE_CONTROL if is_blob else UPLOAD_CACHE_CONTROL}
+        )